@@ -1,25 +1,45 @@
 import xpublish
 
+from contextlib import asynccontextmanager
+from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
 from xreds.config import settings
 from xreds.middleware import RequestCancelledMiddleware, WmsGZipMiddleware
 from xreds.logging import logger, configure_app_logger, configure_fastapi_logger
 from xreds.plugins.export import ExportPlugin
+from xreds.plugins.health_plugin import HealthPlugin
 from xreds.plugins.size_plugin import SizePlugin
 from xreds.spastaticfiles import SPAStaticFiles
 from xreds.dataset_provider import DatasetProvider
+from xreds.prewarm import DatasetPrewarmer
 from xreds.plugins.subset_plugin import SubsetPlugin, SubsetSupportPlugin
 
 configure_app_logger()
 logger.info(f"XREDs started with settings: {settings.__dict__}")
 
+dataset_provider = DatasetProvider()
+prewarmer = DatasetPrewarmer(
+    get_dataset=dataset_provider.get_dataset,
+    get_dataset_specs=lambda: dataset_provider.dataset_mapping,
+    concurrency=settings.prewarm_concurrency,
+)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    async with configure_fastapi_logger(app):
+        if settings.prewarm_datasets:
+            prewarmer.start()
+        yield
+
+
 rest = xpublish.Rest(
     app_kws=dict(
         title="XREDS",
         description="XArray Environmental Data Services exposes environmental model data in common data formats for digestion in applications and notebooks",
         openapi_url="/xreds.json",
-        lifespan=configure_fastapi_logger
+        lifespan=lifespan
     ),
     cache_kws=dict(available_bytes=1e9),
     datasets=None,
@@ -27,11 +47,12 @@ rest = xpublish.Rest(
 
 export_threshold = settings.export_threshold
 
-rest.register_plugin(DatasetProvider())
+rest.register_plugin(dataset_provider)
 rest.register_plugin(SubsetSupportPlugin())
 rest.register_plugin(SubsetPlugin())
 rest.register_plugin(SizePlugin())
 rest.register_plugin(ExportPlugin())
+rest.register_plugin(HealthPlugin(prewarmer=prewarmer))
 
 app = rest.app
 
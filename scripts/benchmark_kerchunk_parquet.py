@@ -0,0 +1,59 @@
+"""Benchmark opening kerchunk JSON references against parquet references
+
+Each reference set is opened in a fresh process so the open time and the resident
+memory it adds are measured without fsspec's instance cache or a warm interpreter.
+
+Usage:
+    python scripts/kerchunk_to_parquet.py datasets/fort.63_post_1980-1981.json /tmp/fort.63.parq
+    python scripts/benchmark_kerchunk_parquet.py datasets/fort.63_post_1980-1981.json /tmp/fort.63.parq
+"""
+import argparse
+import multiprocessing
+import os
+import resource
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+
+def open_references(path: str, queue: multiprocessing.Queue):
+    # import the reference readers up front so their import cost is not measured
+    import fastparquet  # noqa: F401
+    import fsspec.implementations.reference  # noqa: F401
+    import kerchunk.xarray_backend  # noqa: F401
+    from xreds.dataset_utils import load_dataset
+
+    start_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start_time = time.perf_counter()
+    ds = load_dataset({"path": path, "type": "kerchunk", "chunks": {}})
+    open_time = time.perf_counter() - start_time
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - start_rss
+
+    queue.put((open_time, rss / 1024, len(ds.variables)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("paths", nargs="+", help="kerchunk JSON files or parquet reference directories")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    context = multiprocessing.get_context("spawn")
+    print(f"{'references':<60}{'open (s)':>12}{'rss (MB)':>12}{'variables':>12}")
+    for path in args.paths:
+        results = []
+        for _ in range(args.repeat):
+            queue = context.Queue()
+            process = context.Process(target=open_references, args=(path, queue))
+            process.start()
+            results.append(queue.get())
+            process.join()
+
+        open_time = min(result[0] for result in results)
+        rss = min(result[1] for result in results)
+        print(f"{path:<60}{open_time:>12.3f}{rss:>12.1f}{results[0][2]:>12}")
+
+
+if __name__ == "__main__":
+    main()
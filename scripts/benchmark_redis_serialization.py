@@ -0,0 +1,102 @@
+"""Benchmark the redis dataset serialization against plain pickle, the format redis
+cached datasets were stored in before
+
+Both formats pickle the dask graphs of the lazy variables, the frame format only writes the
+array buffers of the dataset out of band, compressed.
+
+Usage:
+    python scripts/benchmark_redis_serialization.py
+    python scripts/benchmark_redis_serialization.py --mapping datasets/datasets.yml --dataset cbofs
+
+Without a mapping file a synthetic unstructured mesh dataset with eagerly loaded
+coordinates and dask backed data variables is used.
+"""
+import argparse
+import copy
+import os
+import pickle
+import sys
+import tempfile
+import time
+
+import numpy as np
+import xarray as xr
+import yaml
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from xreds.dataset_utils import hash_dataset_spec, load_dataset  # noqa: E402
+from xreds.serialization import CODECS, deserialize_dataset, serialize_dataset  # noqa: E402
+
+
+def synthetic_dataset(num_nodes: int, num_times: int) -> xr.Dataset:
+    rng = np.random.default_rng(0)
+    ds = xr.Dataset(
+        {
+            "zeta": (("time", "node"), rng.random((num_times, num_nodes), dtype="float32")),
+        },
+        coords={
+            "time": np.arange(num_times).astype("datetime64[h]").astype("datetime64[ns]"),
+            "x": ("node", rng.uniform(-100, -60, num_nodes)),
+            "y": ("node", rng.uniform(20, 50, num_nodes)),
+            "element": (("nele", "nvertex"), rng.integers(0, num_nodes, (num_nodes * 2, 3), dtype="int32")),
+        },
+    )
+
+    # reopen from a zarr store so data variables are lazily backed like a real dataset,
+    # while the coordinates are eagerly loaded
+    path = os.path.join(tempfile.mkdtemp(), "synthetic.zarr")
+    ds.to_zarr(path, mode="w")
+    ds = xr.open_dataset(path, engine="zarr", chunks={})
+    return ds.assign_coords({name: ds[name].load() for name in ds.coords})
+
+
+def timed(func, repeat: int):
+    best = float("inf")
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mapping", help="dataset mapping file to load the dataset from")
+    parser.add_argument("--dataset", help="dataset id in the mapping file")
+    parser.add_argument("--nodes", type=int, default=2_000_000, help="synthetic mesh nodes")
+    parser.add_argument("--times", type=int, default=240, help="synthetic time steps")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    if args.mapping:
+        with open(args.mapping) as f:
+            spec = yaml.safe_load(f)[args.dataset]
+        ds = load_dataset(copy.deepcopy(spec))
+        spec_hash = hash_dataset_spec(spec)
+    else:
+        ds = synthetic_dataset(args.nodes, args.times)
+        spec_hash = ""
+
+    print(f"{'format':<10}{'size (MB)':>12}{'dump (s)':>12}{'load (s)':>12}{'dump speedup':>14}{'load speedup':>14}")
+
+    pickle_dump_time, payload = timed(lambda: pickle.dumps(ds, protocol=-1), args.repeat)
+    pickle_load_time, _ = timed(lambda: pickle.loads(payload), args.repeat)
+    print(f"{'pickle':<10}{len(payload) / 1024**2:>12.2f}{pickle_dump_time:>12.3f}{pickle_load_time:>12.3f}")
+
+    for compression in CODECS:
+        try:
+            dump_time, payload = timed(lambda: serialize_dataset(ds, spec_hash, compression), args.repeat)
+        except ImportError:
+            print(f"{compression:<10} (not installed)")
+            continue
+        load_time, _ = timed(lambda: deserialize_dataset(payload, spec_hash), args.repeat)
+        print(
+            f"{compression:<10}{len(payload) / 1024**2:>12.2f}{dump_time:>12.3f}{load_time:>12.3f}"
+            f"{pickle_dump_time / dump_time:>13.1f}x{pickle_load_time / load_time:>13.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
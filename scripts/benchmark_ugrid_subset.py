@@ -0,0 +1,98 @@
+"""Benchmark polygon and bbox subsets of a large synthetic UGRID mesh
+
+Compares xarray_subset_grid computing every subset from scratch against the cached
+spatial index used by the subset plugin, and checks both select the same nodes and faces.
+
+Usage:
+    python scripts/benchmark_ugrid_subset.py --nodes 2000000
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import xarray as xr
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from xarray_subset_grid.grids.ugrid import assign_ugrid_topology  # noqa: E402
+
+from xreds.spatial_index import UGridSubsetIndex  # noqa: E402
+
+
+def synthetic_mesh(n_nodes: int) -> xr.Dataset:
+    """Triangulated, jittered regular grid over the US east coast, like an ADCIRC mesh"""
+    side = int(np.sqrt(n_nodes))
+    lon, lat = np.meshgrid(np.linspace(-82, -60, side), np.linspace(24, 46, side))
+    rng = np.random.default_rng(0)
+    lon = lon.ravel() + rng.normal(0, 0.2 * 22 / side, side * side)
+    lat = lat.ravel() + rng.normal(0, 0.2 * 22 / side, side * side)
+
+    corner = (np.arange(side - 1)[None, :] + side * np.arange(side - 1)[:, None]).ravel()
+    lower = np.stack([corner, corner + 1, corner + side], axis=1)
+    upper = np.stack([corner + 1, corner + side + 1, corner + side], axis=1)
+    element = np.concatenate([lower, upper]) + 1
+
+    ds = xr.Dataset(
+        {
+            "element": (("nele", "nvertex"), element.astype(np.int32), {"start_index": 1}),
+            "depth": ("node", rng.random(side * side)),
+        },
+        coords={
+            "x": ("node", lon, {"standard_name": "longitude", "units": "degrees_east"}),
+            "y": ("node", lat, {"standard_name": "latitude", "units": "degrees_north"}),
+        },
+    )
+    return assign_ugrid_topology(ds, face_node_connectivity="element", start_index=1)
+
+
+def timed(fn, repeat: int) -> tuple[float, object]:
+    times = []
+    for _ in range(repeat):
+        start_time = time.perf_counter()
+        result = fn()
+        times.append(time.perf_counter() - start_time)
+    return min(times), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--nodes", type=int, default=2_000_000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    ds = synthetic_mesh(args.nodes)
+    print(f"mesh: {ds.sizes['node']} nodes, {ds.sizes['nele']} faces")
+
+    build_time, index = timed(lambda: UGridSubsetIndex(ds), 1)
+    print(f"index build: {build_time:.3f}s")
+
+    queries = {
+        "bbox (chesapeake)": ("bbox", (-77.5, 36.5, -75.5, 39.6)),
+        "polygon (gulf of maine)": ("polygon", np.array([[-71, 41], [-66, 42], [-66, 45], [-70, 44], [-71, 41]])),
+        "polygon (half domain)": ("polygon", np.array([[-82, 24], [-60, 24], [-60, 35], [-82, 35], [-82, 24]])),
+    }
+
+    print(f"{'query':<28}{'xsg (s)':>12}{'indexed (s)':>14}{'speedup':>10}{'nodes':>10}{'same':>6}")
+    for label, (kind, query) in queries.items():
+        if kind == "bbox":
+            xsg_time, expected = timed(lambda: ds.xsg.grid.compute_bbox_subset_selector(ds, query), args.repeat)
+            index_time, selector = timed(lambda: index.compute_bbox_subset_selector(query), args.repeat)
+        else:
+            xsg_time, expected = timed(lambda: ds.xsg.grid.compute_polygon_subset_selector(ds, query.copy()), args.repeat)
+            index_time, selector = timed(lambda: index.compute_polygon_subset_selector(query), args.repeat)
+
+        same = (
+            np.array_equal(expected._selected_nodes, selector._selected_nodes)
+            and np.array_equal(expected._selected_elements, selector._selected_elements)
+            and np.array_equal(np.asarray(expected._face_node_connectivity), selector._face_node_connectivity)
+        )
+        print(
+            f"{label:<28}{xsg_time:>12.3f}{index_time:>14.4f}{xsg_time / index_time:>9.0f}x"
+            f"{len(selector._selected_nodes):>10}{str(same):>6}"
+        )
+
+
+if __name__ == "__main__":
+    main()
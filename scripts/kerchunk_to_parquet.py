@@ -0,0 +1,45 @@
+"""Convert kerchunk JSON references to a parquet reference store
+
+Parquet references are loaded lazily per variable and chunk by fsspec's
+LazyReferenceMapper, instead of parsing the whole JSON file into memory when the
+dataset is opened. Datasets pointing at a .parq directory are opened as kerchunk.
+
+Usage:
+    python scripts/kerchunk_to_parquet.py datasets/fort.63_post_1980-1981.json datasets/fort.63_post_1980-1981.parq
+    python scripts/kerchunk_to_parquet.py s3://bucket/refs.json s3://bucket/refs.parq --anon
+"""
+import argparse
+import json
+import time
+
+import fsspec
+from kerchunk.df import refs_to_dataframe
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("source", help="fsspec path of the kerchunk JSON references")
+    parser.add_argument("target", help="fsspec path of the parquet reference directory to write")
+    parser.add_argument("--record-size", type=int, default=100_000, help="references per parquet file")
+    parser.add_argument("--anon", action="store_true", help="read and write remote paths anonymously")
+    args = parser.parse_args()
+
+    storage_options = {"anon": True} if args.anon else {}
+
+    start_time = time.time()
+    with fsspec.open(args.source, "r", **storage_options) as f:
+        refs = json.load(f)
+    print(f"Read {len(refs.get('refs', refs))} references from {args.source} in {time.time() - start_time:.2f}s")
+
+    start_time = time.time()
+    refs_to_dataframe(
+        refs,
+        args.target,
+        storage_options=storage_options or None,
+        record_size=args.record_size,
+    )
+    print(f"Wrote parquet references to {args.target} in {time.time() - start_time:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+import numpy as np
+import pandas as pd
+import pytest
+import xarray as xr
+from xarray_subset_grid.grids.ugrid import assign_ugrid_topology
+
+from xreds.config import settings
+from xreds.plugins.subset_plugin import SubsetQuery
+from xreds.read_planner import (
+    ReadPlanStats,
+    _plan_dimension,
+    plan_reads,
+    planned_array,
+    read_plan_stats,
+    storage_chunks,
+)
+
+
+UGRID_QUERIES = [
+    "POLYGON((-74 38,-70 38.5,-71 41,-74 40,-74 38))",
+    "BBOX(-75,37,-72,39.5)",
+    "BBOX(-75,37,-72,39.5)&TIME(2024-01-02T00:00:00Z,2024-01-03T00:00:00Z)",
+    "TIME(2024-01-02T00:00:00Z,2024-01-03T00:00:00Z)",
+]
+
+
+def synthetic_mesh(side: int = 60) -> xr.Dataset:
+    """Triangulated regular grid with a time varying node variable"""
+    lon, lat = np.meshgrid(np.linspace(-76, -68, side), np.linspace(36, 42, side))
+    corner = (np.arange(side - 1)[None, :] + side * np.arange(side - 1)[:, None]).ravel()
+    lower = np.stack([corner, corner + 1, corner + side], axis=1)
+    upper = np.stack([corner + 1, corner + side + 1, corner + side], axis=1)
+    element = np.concatenate([lower, upper]) + 1
+
+    rng = np.random.default_rng(0)
+    times = pd.date_range("2024-01-01", periods=4, freq="D")
+    ds = xr.Dataset(
+        {
+            "element": (("nele", "nvertex"), element.astype(np.int32), {"start_index": 1}),
+            "depth": ("node", rng.random(side * side)),
+            "zeta": (("time", "node"), rng.random((len(times), side * side))),
+        },
+        coords={
+            "x": ("node", lon.ravel(), {"standard_name": "longitude", "units": "degrees_east"}),
+            "y": ("node", lat.ravel(), {"standard_name": "latitude", "units": "degrees_north"}),
+            "time": ("time", times, {"standard_name": "time"}),
+        },
+    )
+    ds["zeta"].encoding["chunks"] = (1, 500)
+    ds["depth"].encoding["chunks"] = (500,)
+    ds["element"].encoding["chunks"] = (1000, 3)
+    return assign_ugrid_topology(ds, face_node_connectivity="element", start_index=1)
+
+
+@pytest.fixture(scope="module")
+def mesh_path(tmp_path_factory):
+    path = tmp_path_factory.mktemp("mesh") / "mesh.zarr"
+    synthetic_mesh().to_zarr(path, zarr_format=2)
+    return path
+
+
+def subset(path, chunks, query: str, planned: bool, monkeypatch) -> xr.Dataset:
+    # each subset is read from a freshly opened dataset, so one subset never loads the
+    # variables the other reads
+    monkeypatch.setattr(settings, "use_subset_read_planner", planned)
+    ds = xr.open_zarr(path, chunks=chunks)
+    return SubsetQuery.from_query(query).subset(ds).load()
+
+
+def test_storage_chunks_from_encoding():
+    var = xr.Variable(("time", "node"), np.zeros((4, 10)), encoding={"chunks": (1, 5)})
+    assert storage_chunks(var) == (1, 5)
+
+    var = xr.Variable(("time", "node"), np.zeros((4, 10)), encoding={"preferred_chunks": {"node": 5}})
+    assert storage_chunks(var) == (4, 5)
+
+    assert storage_chunks(xr.Variable(("node",), np.zeros(10))) is None
+
+
+def test_plan_dimension_merges_adjacent_chunks():
+    runs = _plan_dimension(np.array([1, 2, 5, 11, 30, 31]), chunk=5, size=40, max_chunks=4)
+
+    # chunks 0-2 are adjacent, chunk 6 starts a new run after the gap
+    assert [(start, stop) for start, stop, _ in runs] == [(0, 15), (30, 35)]
+    assert [local.tolist() for _, _, local in runs] == [[1, 2, 5, 11], [0, 1]]
+
+
+def test_plan_dimension_limits_run_length():
+    runs = _plan_dimension(np.arange(40), chunk=5, size=40, max_chunks=3)
+    assert [(start, stop) for start, stop, _ in runs] == [(0, 15), (15, 30), (30, 40)]
+
+
+def test_plan_dimension_rejects_unordered_positions():
+    assert _plan_dimension(np.array([3, 1]), chunk=5, size=40, max_chunks=3) is None
+
+
+@pytest.mark.parametrize("dask", [False, True])
+def test_planned_array_matches_selection(dask):
+    data = np.arange(40 * 30, dtype=np.float64).reshape(40, 30)
+    var = xr.Variable(("y", "x"), data, encoding={"chunks": (8, 8)})
+    if dask:
+        var = var.chunk({"y": 8, "x": 8})
+    indexers = {"y": slice(3, 29), "x": np.array([0, 1, 9, 17, 18, 29])}
+
+    plan = plan_reads(var, indexers, max_block_bytes=2 * 8 * 8 * 8)
+    array = planned_array(var, plan, "test")
+
+    np.testing.assert_array_equal(array.compute(), data[3:29][:, indexers["x"]])
+    # the planned subset keeps the storage chunks of the source
+    assert array.chunks == ((8, 8, 8, 2), (6,))
+
+
+def test_stats_are_recorded_when_blocks_are_read(monkeypatch):
+    stats = ReadPlanStats()
+    monkeypatch.setattr("xreds.read_planner.read_plan_stats", stats)
+
+    var = xr.Variable(("x",), np.arange(20.0), encoding={"chunks": (5,)})
+    array = planned_array(var, plan_reads(var, {"x": slice(2, 8)}, 1024), "test")
+    assert stats.stats() == {}
+
+    array.compute()
+    assert stats.stats()["test"]["selected_bytes"] == 6 * 8
+    assert stats.stats()["test"]["fetched_bytes"] == 10 * 8
+    assert stats.stats()["test"]["chunk_reads"] == 2
+
+
+@pytest.mark.parametrize("chunks", [{}, None])
+@pytest.mark.parametrize("query", UGRID_QUERIES)
+def test_planned_ugrid_subset_matches_selection(mesh_path, chunks, query, monkeypatch):
+    expected = subset(mesh_path, chunks, query, planned=False, monkeypatch=monkeypatch)
+    actual = subset(mesh_path, chunks, query, planned=True, monkeypatch=monkeypatch)
+
+    assert set(actual.variables) == set(expected.variables)
+    for name in expected.variables:
+        xr.testing.assert_identical(actual[name], expected[name])
+
+
+def test_planned_ugrid_subset_renumbers_connectivity(mesh_path, monkeypatch):
+    actual = subset(mesh_path, {}, UGRID_QUERIES[1], planned=True, monkeypatch=monkeypatch)
+
+    # connectivity is rewritten by the selector, so it must not be re-read from the source
+    assert int(actual["element"].max()) <= actual.sizes["node"]
+    assert int(actual["element"].min()) >= 1
+
+
+def test_planned_subset_reads_are_recorded(mesh_path, monkeypatch):
+    before = read_plan_stats.stats().get("", {}).get("blocks_read", 0)
+    subset(mesh_path, {}, UGRID_QUERIES[0], planned=True, monkeypatch=monkeypatch)
+    assert read_plan_stats.stats()[""]["blocks_read"] > before
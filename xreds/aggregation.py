@@ -0,0 +1,170 @@
+import hashlib
+import json
+import os
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Union
+
+import fsspec
+
+from xreds.dataset_utils import get_file_version
+from xreds.logging import logger
+
+
+class NetCDFAggregation:
+    """Kerchunk references combining many netcdf files along one dimension, cached on disk
+
+    Each member file is scanned into its own references once, in parallel, and the scanned
+    references are kept in an index file next to the combined references together with the
+    version (ETag or modification time) of every member. Later builds only scan members that
+    are new or changed, and reuse the combined references as is when no member changed.
+    """
+
+    def __init__(
+        self,
+        cache_dir: str,
+        cache_key: str,
+        concat_dim: str = "time",
+        identical_dims: Optional[list[str]] = None,
+        storage_options: Optional[dict] = None,
+        max_workers: int = 8,
+    ):
+        self.cache_dir = cache_dir
+        self.cache_key = cache_key
+        self.concat_dim = concat_dim
+        self.identical_dims = identical_dims
+        self.storage_options = storage_options or {}
+        self.max_workers = max(1, max_workers)
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    @property
+    def references_path(self) -> str:
+        return os.path.join(self.cache_dir, f"{self.cache_key}.json")
+
+    @property
+    def index_path(self) -> str:
+        return os.path.join(self.cache_dir, f"{self.cache_key}.members.json")
+
+    def list_members(self, paths: Union[str, list[str]]) -> dict[str, Optional[str]]:
+        """Versions of the member files matching a glob or list of paths, keyed by url"""
+        members = {}
+        for path in [paths] if isinstance(paths, str) else paths:
+            fs, fs_path = fsspec.core.url_to_fs(path, **self.storage_options)
+            protocol = fsspec.utils.get_protocol(path)
+            for member_path, info in fs.glob(fs_path, detail=True).items():
+                url = member_path if protocol == "file" else f"{protocol}://{member_path}"
+                members[url] = get_file_version(info)
+        return members
+
+    def build(self, paths: Union[str, list[str]]) -> str:
+        """Update the combined references for the current member files, returning their path"""
+        members = self.list_members(paths)
+        if len(members) == 0:
+            raise ValueError(f"No files found for netcdf aggregation {paths}")
+
+        members_hash = hashlib.sha256(json.dumps(sorted(members.items())).encode()).hexdigest()
+        index = self._load_index()
+        if index.get("members_hash", None) == members_hash and os.path.exists(self.references_path):
+            return self.references_path
+
+        cached_members = index.get("members", {})
+        stale = [
+            url for url, version in members.items()
+            if url not in cached_members or cached_members[url]["version"] != version
+        ]
+
+        start_time = time.time()
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="xreds-aggregation") as executor:
+            scanned = dict(zip(stale, executor.map(self._scan_member, stale)))
+        logger.info(
+            f"Scanned {len(stale)} of {len(members)} netcdf aggregation members in {time.time() - start_time}s"
+        )
+
+        member_refs = {
+            url: {"version": version, "refs": scanned[url] if url in scanned else cached_members[url]["refs"]}
+            for url, version in members.items()
+        }
+
+        start_time = time.time()
+        references = self._combine(
+            [member_refs[url]["refs"] for url in sorted(member_refs)],
+            remote_protocol=fsspec.utils.get_protocol(next(iter(members))),
+        )
+        self._write_json(self.references_path, references)
+        self._write_json(self.index_path, {"members_hash": members_hash, "members": member_refs})
+        logger.info(f"Combined {len(members)} netcdf aggregation members in {time.time() - start_time}s")
+
+        return self.references_path
+
+    def _scan_member(self, url: str) -> dict:
+        # imported here since kerchunk is only needed to build aggregations
+        from kerchunk.hdf import SingleHdf5ToZarr
+
+        try:
+            with fsspec.open(url, "rb", **self.storage_options) as f:
+                return SingleHdf5ToZarr(f, url, inline_threshold=300).translate()
+        except OSError:
+            # not HDF5 based, netCDF classic files are scanned as netCDF3
+            from kerchunk.netCDF3 import NetCDF3ToZarr
+
+            return NetCDF3ToZarr(url, storage_options=self.storage_options, inline_threshold=300).translate()
+
+    def _combine(self, member_refs: list[dict], remote_protocol: str) -> dict:
+        from kerchunk.combine import MultiZarrToZarr
+
+        if len(member_refs) == 1:
+            return member_refs[0]
+
+        identical_dims = self.identical_dims
+        if identical_dims is None:
+            identical_dims = _static_variable_names(member_refs[0], self.concat_dim)
+
+        # members usually encode time relative to their own start, so decode it with cftime
+        # to concatenate real times instead of the raw offsets
+        coo_map = {}
+        if _has_time_units(member_refs[0], self.concat_dim):
+            coo_map[self.concat_dim] = f"cf:{self.concat_dim}"
+
+        return MultiZarrToZarr(
+            member_refs,
+            remote_protocol=remote_protocol,
+            remote_options=self.storage_options,
+            concat_dims=[self.concat_dim],
+            identical_dims=identical_dims,
+            coo_map=coo_map,
+        ).translate()
+
+    def _load_index(self) -> dict:
+        try:
+            with open(self.index_path) as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    @staticmethod
+    def _write_json(path: str, data: dict):
+        tmp_path = f"{path}.{os.getpid()}-{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(data, f)
+        os.replace(tmp_path, path)
+
+
+def _static_variable_names(refs: dict, concat_dim: str) -> list[str]:
+    """Variables of a member that do not vary along the concatenated dimension, like the mesh"""
+    names = []
+    for key, value in refs["refs"].items():
+        if not key.endswith("/.zattrs") or key.count("/") != 1:
+            continue
+        dims = json.loads(value).get("_ARRAY_DIMENSIONS", [])
+        if concat_dim not in dims:
+            names.append(key.split("/")[0])
+    return sorted(names)
+
+
+def _has_time_units(refs: dict, name: str) -> bool:
+    attrs = refs["refs"].get(f"{name}/.zattrs", None)
+    if attrs is None:
+        return False
+    return " since " in json.loads(attrs).get("units", "")
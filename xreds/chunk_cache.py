@@ -0,0 +1,400 @@
+import asyncio
+import hashlib
+import os
+import struct
+import threading
+import time
+import uuid
+from typing import Optional, Protocol
+
+import redis
+from zarr.abc.store import ByteRequest, Store
+from zarr.core.buffer import Buffer, BufferPrototype
+from zarr.storage import WrapperStore
+
+from xreds.logging import logger
+from xreds.redis import get_redis_cache
+
+
+# metadata documents are small, change when datasets are updated, and are already cached
+# in the opened dataset - only chunk bytes are worth caching
+METADATA_KEY_SUFFIXES = ("zarr.json", ".zarray", ".zattrs", ".zgroup", ".zmetadata")
+
+# every cache file starts with the time it expires at, 0 if it never expires
+EXPIRES_AT = struct.Struct("<d")
+
+# returns a cached chunk and marks it as recently used. Chunks that expired are
+# removed from the namespace index so their size stops counting towards the budget
+# KEYS: chunk key, lru index, sizes hash, total size counter  ARGV: now
+REDIS_GET_SCRIPT = """
+local value = redis.call('get', KEYS[1])
+if value then
+    redis.call('zadd', KEYS[2], 'XX', ARGV[1], KEYS[1])
+    return value
+end
+local size = redis.call('hget', KEYS[3], KEYS[1])
+if size then
+    redis.call('zrem', KEYS[2], KEYS[1])
+    redis.call('hdel', KEYS[3], KEYS[1])
+    redis.call('decrby', KEYS[4], size)
+end
+return nil
+"""
+
+# stores a chunk and evicts the least recently used chunks of the namespace until it is
+# back under the target size. Returns the number of evicted chunks
+# KEYS: chunk key, lru index, sizes hash, total size counter
+# ARGV: data, ttl in ms (0 = none), now, max bytes (0 = unlimited), target bytes
+REDIS_PUT_SCRIPT = """
+local size = string.len(ARGV[1])
+local ttl = tonumber(ARGV[2])
+if ttl > 0 then
+    redis.call('set', KEYS[1], ARGV[1], 'PX', ttl)
+else
+    redis.call('set', KEYS[1], ARGV[1])
+end
+
+local old_size = tonumber(redis.call('hget', KEYS[3], KEYS[1]) or '0')
+redis.call('hset', KEYS[3], KEYS[1], size)
+redis.call('zadd', KEYS[2], ARGV[3], KEYS[1])
+local total = redis.call('incrby', KEYS[4], size - old_size)
+
+local evicted = 0
+local max_bytes = tonumber(ARGV[4])
+if max_bytes > 0 and total > max_bytes then
+    local target_bytes = tonumber(ARGV[5])
+    while total > target_bytes do
+        local oldest = redis.call('zpopmin', KEYS[2])
+        if #oldest == 0 then
+            break
+        end
+        local oldest_size = tonumber(redis.call('hget', KEYS[3], oldest[1]) or '0')
+        redis.call('hdel', KEYS[3], oldest[1])
+        redis.call('del', oldest[1])
+        total = redis.call('decrby', KEYS[4], oldest_size)
+        evicted = evicted + 1
+    end
+end
+
+-- the index of a namespace that is no longer written to expires with its chunks
+if ttl > 0 then
+    for i = 2, 4 do
+        redis.call('pexpire', KEYS[i], ttl)
+    end
+end
+return evicted
+"""
+
+
+class ChunkCache(Protocol):
+    def get(self, namespace: str, key: str) -> Optional[bytes]: ...
+
+    def put(self, namespace: str, key: str, data: bytes, ttl: int = 0): ...
+
+
+class DiskChunkCache:
+    """Node local LRU cache of raw (still compressed) chunk bytes
+
+    Chunks are stored one per file under root/<namespace>/, written to a temporary file and
+    atomically renamed into place so concurrent workers never read partial chunks. Reads bump
+    the file modification time, and once the cache grows past max_bytes the least recently
+    used files are removed until it is back under 90% of the budget. Each process tracks the
+    size it has added since the last scan so the directory is only scanned when needed.
+    """
+
+    def __init__(self, root: str, max_bytes: int):
+        self.root = root
+        self.max_bytes = max_bytes
+
+        self._lock = threading.Lock()
+        self._size_estimate: Optional[int] = None
+
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.writes = 0
+        self.evictions = 0
+
+        os.makedirs(self.root, exist_ok=True)
+
+    def __reduce__(self):
+        # stores wrapping the cache are pickled into the redis cache, resolve to the
+        # cache instance of the process that unpickles them
+        return get_disk_chunk_cache, (self.root, self.max_bytes)
+
+    def get(self, namespace: str, key: str) -> Optional[bytes]:
+        path = self._get_path(namespace, key)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            with self._lock:
+                self.misses += 1
+            return None
+
+        expires_at = EXPIRES_AT.unpack_from(data)[0] if len(data) >= EXPIRES_AT.size else -1
+        if expires_at < 0 or (expires_at > 0 and expires_at < time.time()):
+            self._remove(path)
+            with self._lock:
+                self.misses += 1
+                self.expired += 1
+            return None
+
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            pass
+        with self._lock:
+            self.hits += 1
+        return data[EXPIRES_AT.size:]
+
+    def put(self, namespace: str, key: str, data: bytes, ttl: int = 0):
+        path = self._get_path(namespace, key)
+        tmp_path = f"{path}.{os.getpid()}-{uuid.uuid4().hex}.tmp"
+        expires_at = time.time() + ttl if ttl > 0 else 0
+
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(tmp_path, "wb") as f:
+                f.write(EXPIRES_AT.pack(expires_at))
+                f.write(data)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning(f"Could not write chunk {key} to disk cache: {e}")
+            self._remove(tmp_path)
+            return
+
+        with self._lock:
+            self.writes += 1
+            if self._size_estimate is not None:
+                self._size_estimate += len(data) + EXPIRES_AT.size
+            needs_eviction = self._size_estimate is None or self._size_estimate > self.max_bytes
+
+        if needs_eviction:
+            self.evict()
+
+    def evict(self):
+        """Scan the cache and remove the least recently used chunks until it fits the budget"""
+        entries = []
+        total_size = 0
+        for dirpath, _, filenames in os.walk(self.root):
+            for filename in filenames:
+                path = os.path.join(dirpath, filename)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+                total_size += stat.st_size
+
+        evicted = 0
+        if self.max_bytes > 0 and total_size > self.max_bytes:
+            target_size = int(self.max_bytes * 0.9)
+            entries.sort()
+            for _, size, path in entries:
+                if total_size <= target_size:
+                    break
+                self._remove(path)
+                total_size -= size
+                evicted += 1
+
+        with self._lock:
+            self._size_estimate = total_size
+            self.evictions += evicted
+
+        if evicted > 0:
+            logger.info(f"Evicted {evicted} chunks from disk chunk cache {self.root}")
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "root": self.root,
+                "max_bytes": self.max_bytes,
+                "current_bytes": self._size_estimate,
+                "hits": self.hits,
+                "misses": self.misses,
+                "expired": self.expired,
+                "writes": self.writes,
+                "evictions": self.evictions,
+            }
+
+    def _get_path(self, namespace: str, key: str) -> str:
+        digest = hashlib.sha256(key.encode()).hexdigest()
+        return os.path.join(self.root, namespace, digest[:2], digest)
+
+    @staticmethod
+    def _remove(path: str):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+_disk_chunk_caches: dict[tuple[str, int], DiskChunkCache] = {}
+_chunk_caches_lock = threading.Lock()
+
+
+def get_disk_chunk_cache(root: str, max_bytes: int) -> DiskChunkCache:
+    """Process wide disk chunk cache for a directory"""
+    with _chunk_caches_lock:
+        cache = _disk_chunk_caches.get((root, max_bytes), None)
+        if cache is None:
+            cache = DiskChunkCache(root, max_bytes)
+            _disk_chunk_caches[(root, max_bytes)] = cache
+        return cache
+
+
+def disk_chunk_cache_stats() -> list[dict]:
+    with _chunk_caches_lock:
+        caches = list(_disk_chunk_caches.values())
+    return [cache.stats() for cache in caches]
+
+
+class RedisChunkCache:
+    """LRU cache of raw chunk bytes in redis, shared by every worker and pod
+
+    Each namespace (dataset) has its own max_bytes budget. Chunk sizes and last access
+    times are tracked in a hash and sorted set per namespace, and lua scripts keep them
+    consistent with the chunks so eviction is atomic across workers. Redis errors are
+    logged and treated as cache misses so reads fall back to the remote store.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.redis_cache: Optional[redis.Redis] = get_redis_cache()
+
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.evictions = 0
+        self.errors = 0
+
+    def __reduce__(self):
+        return get_redis_chunk_cache, (self.max_bytes,)
+
+    def get(self, namespace: str, key: str) -> Optional[bytes]:
+        if self.redis_cache is None:
+            return None
+
+        try:
+            data = self.redis_cache.eval(
+                REDIS_GET_SCRIPT, 4, self._get_key(namespace, key), *self._get_index_keys(namespace), time.time()
+            )
+        except redis.RedisError as e:
+            logger.warning(f"Could not read chunk {key} from redis chunk cache: {e}")
+            with self._lock:
+                self.errors += 1
+            return None
+
+        with self._lock:
+            if data is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return data
+
+    def put(self, namespace: str, key: str, data: bytes, ttl: int = 0):
+        if self.redis_cache is None:
+            return
+
+        try:
+            evicted = self.redis_cache.eval(
+                REDIS_PUT_SCRIPT,
+                4,
+                self._get_key(namespace, key),
+                *self._get_index_keys(namespace),
+                data,
+                int(ttl * 1000),
+                time.time(),
+                self.max_bytes,
+                int(self.max_bytes * 0.9),
+            )
+        except redis.RedisError as e:
+            logger.warning(f"Could not write chunk {key} to redis chunk cache: {e}")
+            with self._lock:
+                self.errors += 1
+            return
+
+        with self._lock:
+            self.writes += 1
+            self.evictions += evicted
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "max_bytes_per_dataset": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "writes": self.writes,
+                "evictions": self.evictions,
+                "errors": self.errors,
+            }
+
+    @staticmethod
+    def _get_key(namespace: str, key: str) -> str:
+        return f"chunk-{namespace}-{hashlib.sha256(key.encode()).hexdigest()}"
+
+    @staticmethod
+    def _get_index_keys(namespace: str) -> tuple[str, str, str]:
+        return f"chunk-lru-{namespace}", f"chunk-sizes-{namespace}", f"chunk-bytes-{namespace}"
+
+
+_redis_chunk_caches: dict[int, RedisChunkCache] = {}
+
+
+def get_redis_chunk_cache(max_bytes: int) -> RedisChunkCache:
+    """Process wide redis chunk cache for a per dataset budget"""
+    with _chunk_caches_lock:
+        cache = _redis_chunk_caches.get(max_bytes, None)
+        if cache is None:
+            cache = RedisChunkCache(max_bytes)
+            _redis_chunk_caches[max_bytes] = cache
+        return cache
+
+
+def redis_chunk_cache_stats() -> list[dict]:
+    with _chunk_caches_lock:
+        caches = list(_redis_chunk_caches.values())
+    return [cache.stats() for cache in caches]
+
+
+class CachingStore(WrapperStore[Store]):
+    """Zarr store wrapper that reads whole chunks through a chunk cache
+
+    Works with any zarr v3 store - fsspec reference filesystems, obstore and icechunk
+    sessions - since it caches the raw bytes the store returns before they are decoded.
+    Partial reads (e.g. of shards) and metadata documents are passed straight through.
+    Wrappers can be stacked to check a node local cache before a shared one.
+    """
+
+    def __init__(self, store: Store, cache: ChunkCache, namespace: str, ttl: int = 0):
+        super().__init__(store)
+        self.cache = cache
+        self.namespace = namespace
+        self.ttl = ttl
+
+    def _with_store(self, store: Store) -> "CachingStore":
+        return type(self)(store, self.cache, self.namespace, self.ttl)
+
+    async def get(
+        self,
+        key: str,
+        prototype: BufferPrototype,
+        byte_range: Optional[ByteRequest] = None,
+    ) -> Optional[Buffer]:
+        if byte_range is not None or key.endswith(METADATA_KEY_SUFFIXES):
+            return await self._store.get(key, prototype, byte_range)
+
+        data = await asyncio.to_thread(self.cache.get, self.namespace, key)
+        if data is not None:
+            return prototype.buffer.from_bytes(data)
+
+        value = await self._store.get(key, prototype, byte_range)
+        if value is not None:
+            await asyncio.to_thread(self.cache.put, self.namespace, key, value.to_bytes(), self.ttl)
+        return value
+
+    def __repr__(self) -> str:
+        return f"CachingStore({self._store!r}, namespace={self.namespace!r})"
@@ -7,6 +7,11 @@ class Settings(BaseSettings):
     # in either json or yml format
     datasets_mapping_file: str = ''
 
+    # Interval in seconds to check the dataset mapping file for changes, using its
+    # modification time or ETag. Datasets whose spec changed are reloaded
+    # 0 = never reload
+    datasets_mapping_refresh_interval: int = 0
+
     # Root path for the service to mount at
     root_path: str = ''
 
@@ -14,9 +19,39 @@ class Settings(BaseSettings):
     # in MB
     export_threshold: int = 500
 
+    # Whether to load every dataset in the mapping file into the caches when a
+    # worker starts. Workers report ready on /health/ready once this finishes
+    prewarm_datasets: bool = False
+
+    # Number of datasets prewarmed concurrently per gunicorn worker
+    prewarm_concurrency: int = 2
+
     # Timeout for caching datasets in seconds
     dataset_cache_timeout: int = 10 * 60
 
+    # Number of threads per gunicorn worker opening the auxiliary datasets of
+    # extensions, like vdatum grids, concurrently with the datasets using them
+    dataset_load_workers: int = 4
+
+    # Whether to keep serving expired datasets while they are reloaded in the background
+    use_stale_while_revalidate: bool = False
+
+    # Maximum time in seconds past its expiration that a dataset is served while
+    # it is refreshed. After this, requests wait for the dataset to be reloaded
+    dataset_max_stale_age: int = 60 * 60
+
+    # Number of threads per gunicorn worker refreshing expired datasets
+    dataset_refresh_workers: int = 2
+
+    # Timeout in seconds for caching static auxiliary datasets used by extensions,
+    # like vdatum grids. These are shared by every dataset referencing them
+    # 0 = never expire
+    static_dataset_cache_timeout: int = 0
+
+    # Whether to read static auxiliary datasets fully into memory when they are opened.
+    # With use_shared_arrays they are memory mapped and shared between gunicorn workers
+    load_static_datasets: bool = False
+
     # Whether to save datasets into memory after loading
     # NOTE: this memory cache is independent per gunicorn worker
     use_memory_cache: bool = True
@@ -25,9 +60,78 @@ class Settings(BaseSettings):
     # 0 = unlimited
     memory_cache_num_datasets: int = 0
 
+    # Memory budget for datasets cached per gunicorn worker in MB, measured
+    # from the loaded coordinate and index arrays of each dataset
+    # 0 = unlimited
+    memory_cache_max_mb: int = 0
+
+    # Memory budget for the polygon and bbox subset selections cached per gunicorn
+    # worker in MB, reused by every request for the same dataset and subset
+    # 0 = disabled
+    subset_cache_max_mb: int = 256
+
+    # Whether to read the data of polygon, bbox and time subsets in blocks aligned to the
+    # storage chunks of each variable, merging adjacent chunks into a single read
+    use_subset_read_planner: bool = False
+
+    # Size in MB up to which adjacent storage chunks are merged into one subset read
+    subset_read_block_mb: int = 64
+
+    # Number of subset blocks read concurrently per gunicorn worker from lazily opened datasets
+    subset_read_concurrency: int = 8
+
+    # Whether to share the static coordinate and mesh connectivity arrays of memory
+    # cached datasets between the gunicorn workers of a node, by memory mapping them
+    # from files written once per node
+    use_shared_arrays: bool = False
+
+    # Directory for the shared array files, ideally on a tmpfs
+    # If not provided, defaults to /dev/shm/xreds when available
+    shared_array_dir: str = ""
+
+    # Directory for the on-disk cache of remote zarr, kerchunk and icechunk chunks,
+    # shared by the gunicorn workers of a node. Datasets can opt out or set their
+    # own ttl with the chunk_cache key of their dataset spec
+    # If not provided, chunks are not cached on disk
+    chunk_cache_dir: str = ""
+
+    # Size budget of the on-disk chunk cache in MB, the least recently used chunks
+    # are removed once it is exceeded
+    chunk_cache_max_mb: int = 10 * 1024
+
+    # Default time in seconds a chunk is kept in the on-disk and redis chunk caches
+    # 0 = until it is evicted
+    chunk_cache_ttl: int = 24 * 60 * 60
+
+    # Directory for cfgrib index files and scanned grib2 references, keyed by the path
+    # and modification time of each grib2 file so they are only rebuilt when it changes
+    # If not provided, defaults to a directory in the system temp directory
+    grib_cache_dir: str = ""
+
+    # Directory for the combined references of netcdf-aggregation datasets and the
+    # scanned references of their member files
+    # If not provided, defaults to a directory in the system temp directory
+    netcdf_aggregation_cache_dir: str = ""
+
+    # Number of member files of a netcdf-aggregation dataset scanned in parallel
+    netcdf_aggregation_workers: int = 8
+
     # Whether to use redis to cache datasets when possible
     use_redis_cache: bool = False
 
+    # Default size budget in MB of the chunks of each dataset cached in redis, for
+    # datasets that enable the redis chunk cache in their storage_options
+    redis_chunk_cache_max_mb: int = 1024
+
+    # Compression used for datasets serialized into redis
+    # one of zstd, lz4, zlib or none. none reads the cached arrays without copying them
+    redis_cache_compression: str = "none"
+
+    # Time in seconds a worker's lease on loading a dataset lasts without being renewed.
+    # Leases are renewed while the dataset loads, so this only bounds how long other
+    # workers wait before taking over the load from a worker that died
+    dataset_load_lease_ttl: int = 30
+
     # Optional redis host name
     # If not provided, will default to localhost
     redis_host: str = "localhost"
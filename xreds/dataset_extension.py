@@ -18,8 +18,18 @@ class DatasetExtensionSpec:
         """Transform a dataset"""
         pass
 
+    @hookspec
+    def auxiliary_datasets(self, config: dict) -> list[dict]:
+        """Specs of the auxiliary datasets transform_dataset opens, so they can be opened
+        concurrently with the dataset being transformed"""
+        pass
+
 
 class DatasetExtension(BaseModel):
     """Dataset Extension"""
 
     name: str = Field(..., description="Name of the dataset extension")
+
+    def auxiliary_datasets(self, config: dict) -> list[dict]:
+        """Extensions do not open auxiliary datasets by default"""
+        return []
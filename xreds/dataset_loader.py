@@ -0,0 +1,49 @@
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from typing import Awaitable, Callable, Optional, TypeVar, Union
+
+import pluggy
+from pydantic import BaseModel, Field
+import xarray as xr
+
+
+DATASET_LOADER_PLUGIN_NAMESPACE = "xreds_dataset_loader"
+
+
+hookspec = pluggy.HookspecMarker(DATASET_LOADER_PLUGIN_NAMESPACE)
+hookimpl = pluggy.HookimplMarker(DATASET_LOADER_PLUGIN_NAMESPACE)
+
+# threads blocking loader work runs on. The default executor of zarr's event loop is not used,
+# since zarr stores run their own IO on it while an xr.open_dataset running here waits on them
+LOADER_THREADS = 16
+_loader_executor = ThreadPoolExecutor(max_workers=LOADER_THREADS, thread_name_prefix="xreds-loader")
+
+T = TypeVar("T")
+
+
+async def run_blocking(fn: Callable[..., T], *args, **kwargs) -> T:
+    """Run blocking loader work, like a synchronous xr.open_dataset, off of the event loop"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_loader_executor, functools.partial(fn, *args, **kwargs))
+
+
+class DatasetLoaderSpec:
+    """Dataset loader specification"""
+
+    @hookspec
+    def open_dataset(
+        self, dataset_path: str, dataset_spec: dict, chunk_cache: Optional[dict]
+    ) -> Union[xr.Dataset, Awaitable[xr.Dataset]]:
+        """Open a dataset, either directly or from a coroutine
+
+        Coroutines run on zarr's IO event loop, so blocking work like a synchronous
+        xr.open_dataset should be moved off of it with run_blocking
+        """
+        pass
+
+
+class DatasetLoader(BaseModel):
+    """Dataset Loader, registered under the dataset type it opens"""
+
+    name: str = Field(..., description="Dataset type opened by the loader")
@@ -1,24 +1,35 @@
 import copy
-import pickle
+import threading
 import time
+from concurrent.futures import Future, ThreadPoolExecutor
 from datetime import datetime, timedelta
 
 import fsspec
 import redis
 import xarray as xr
 import yaml
+from fastapi import APIRouter
 from pluggy import PluginManager
-from typing import Optional
+from typing import Optional, Sequence
 from xpublish import Plugin, hookimpl
 
 from xreds.config import settings
-from xreds.dataset_extension import DATASET_EXTENSION_PLUGIN_NAMESPACE
+from xreds.dataset_extension import DATASET_EXTENSION_PLUGIN_NAMESPACE, DatasetExtension
+from xreds.derived_cache import derived_cache
 from xreds.dependencies.redis import get_redis
 from xreds.extensions import VDatumTransformationExtension
 from xreds.extensions.roms import ROMSExtension
+from xreds.lease import RedisLease
 from xreds.logging import logger
+from xreds.memory_cache import DatasetMemoryCache
 from xreds.redis import get_redis_cache
-from xreds.dataset_utils import load_dataset
+from xreds.singleflight import RedisLoadNotifier, SingleFlight
+from xreds.shared_arrays import SharedArrayStore, shared_array_store
+from xreds.read_planner import read_plan_stats
+from xreds.static_datasets import static_dataset_store
+from xreds.subset_cache import subset_selection_cache
+from xreds.serialization import SerializationError, deserialize_dataset, serialize_dataset
+from xreds.dataset_utils import get_file_version, hash_dataset_spec, load_dataset
 
 dataset_extension_manager = PluginManager(DATASET_EXTENSION_PLUGIN_NAMESPACE)
 dataset_extension_manager.register(VDatumTransformationExtension, name="vdatum")
@@ -30,24 +41,62 @@ class DatasetProvider(Plugin):
         arbitrary_types_allowed = True
 
     name: str = "xreds_datasets"
+
+    app_router_prefix: str = "/cache"
+    app_router_tags: Sequence[str] = ["cache"]
+
     dataset_mapping: dict = {}
-    dataset_loading: dict = {}
+    dataset_spec_hashes: dict = {}
+    mapping_watcher: Optional[threading.Thread] = None
+    single_flight: SingleFlight = SingleFlight()
 
     cache_times: dict = {}
-    memory_cache: dict = {}
+    memory_cache: DatasetMemoryCache = DatasetMemoryCache()
+    shared_arrays: Optional[SharedArrayStore] = None
     redis_cache: Optional[redis.Redis] = get_redis_cache()
 
+    refresh_executor: Optional[ThreadPoolExecutor] = None
+    load_executor: Optional[ThreadPoolExecutor] = None
+    # timings of the stages of the last load of each dataset in this worker
+    load_timings: dict = {}
+    # minimum time between background refresh attempts of a dataset after one failed
+    refresh_retry_seconds: int = 30
+
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
 
-        # load config using yaml, which can load json or yaml
-        # because yaml is a superset of json
-        try:
-            with fsspec.open(settings.datasets_mapping_file, "r") as f:
-                self.dataset_mapping = yaml.safe_load(f)
-        except:
-            with fsspec.open(settings.datasets_mapping_file, "r", anon=True) as f:
-                self.dataset_mapping = yaml.safe_load(f)
+        self.dataset_mapping = self._load_dataset_mapping()
+        self.dataset_spec_hashes = {
+            dataset_id: hash_dataset_spec(spec) for dataset_id, spec in self.dataset_mapping.items()
+        }
+
+        if settings.datasets_mapping_refresh_interval > 0:
+            self.mapping_watcher = threading.Thread(
+                target=self._watch_dataset_mapping,
+                name="xreds-mapping-watcher",
+                daemon=True,
+            )
+            self.mapping_watcher.start()
+
+        self.shared_arrays = shared_array_store
+        if self.shared_arrays is not None:
+            self.shared_arrays.cleanup()
+
+        self.memory_cache = DatasetMemoryCache(
+            max_bytes=settings.memory_cache_max_mb * 1024**2,
+            max_items=settings.memory_cache_num_datasets,
+            on_evict=self.shared_arrays.release if self.shared_arrays is not None else None,
+        )
+
+    @hookimpl
+    def app_router(self):
+        router = APIRouter(prefix=self.app_router_prefix, tags=list(self.app_router_tags))
+
+        @router.get("/stats", summary="Get dataset cache statistics for the current worker")
+        def get_cache_stats():
+            return self.cache_stats()
+
+        return router
 
     @hookimpl
     def get_datasets(self):
@@ -55,60 +104,238 @@ class DatasetProvider(Plugin):
 
     @hookimpl
     def get_dataset(self, dataset_id: str) -> xr.Dataset:
-        # make sure that if other requests are currently fetching the dataset, just wait for them to finish
-        # otherwise can cause huge memory issues if multiple async threads try to fetch a big dataset simultaneously
-        if (settings.use_memory_cache or self.redis_cache is not None) and self._is_dataset_loading(dataset_id):
-            logger.info(f"Waiting for dataset {dataset_id} to finish loading")
-            while (self._is_dataset_loading(dataset_id)):
-                time.sleep(0.5)
-
         # check if dataset already exists - if so load from cache
         cached_ds = self._load_dataset_from_cache(dataset_id)
         if cached_ds is not None:
             return cached_ds
 
+        # make sure that if other requests are currently fetching the dataset, they share a single load
+        # otherwise can cause huge memory issues if multiple async threads try to fetch a big dataset simultaneously
+        flight_key = self._get_dataset_cache_key(dataset_id)
+        future, is_leader = self.single_flight.join(flight_key)
+        if not is_leader:
+            logger.info(f"Waiting for dataset {dataset_id} to finish loading")
+            return future.result()
+
+        try:
+            ds = self._wait_or_load_dataset(dataset_id)
+            future.set_result(ds)
+            return ds
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            self.single_flight.forget(flight_key, future)
+
+    # waits for another worker that is loading the dataset to publish its result, loading it in
+    # this worker once it holds the load lease - either because no other worker is loading it, or
+    # because the worker loading it died and its lease expired
+    def _wait_or_load_dataset(self, dataset_id: str) -> xr.Dataset:
+        if self.redis_cache is None:
+            return self._load_dataset(dataset_id)
+
+        notifier = RedisLoadNotifier(self.redis_cache)
+        while True:
+            spec_hash = self._get_dataset_spec_hash(dataset_id)
+            lease = RedisLease(
+                self.redis_cache,
+                self._get_loading_cache_key(dataset_id),
+                ttl=settings.dataset_load_lease_ttl,
+            )
+            if lease.acquire():
+                error = None
+                try:
+                    # another worker may have finished loading since the cache was checked
+                    ds = self._load_fresh_dataset_from_redis(dataset_id)
+                    if ds is None:
+                        ds = self._load_dataset(dataset_id, lease=lease)
+                    return ds
+                except BaseException as e:
+                    error = e
+                    raise
+                finally:
+                    lease.release()
+                    notifier.publish(dataset_id, spec_hash, error=error)
+
+            logger.info(f"Waiting for dataset {dataset_id} to finish loading in another worker")
+            notifier.wait(dataset_id, spec_hash, lambda: self._is_dataset_loading(dataset_id))
+
+            ds = self._load_fresh_dataset_from_redis(dataset_id)
+            if ds is not None:
+                return ds
+
+    def _load_dataset(self, dataset_id: str, lease: Optional[RedisLease] = None) -> xr.Dataset:
+        load_time = time.time()
+        timings = {}
+
+        dataset_spec = copy.deepcopy(self.dataset_mapping[dataset_id])
+        extensions = self._get_dataset_extensions(dataset_id, dataset_spec)
+
+        # open the auxiliary datasets of the extensions while the dataset itself is opened, so
+        # a cold load takes as long as the slowest open instead of the sum of them
+        auxiliary_futures = []
+        for extension, ext_config in extensions:
+            for auxiliary_spec in extension.auxiliary_datasets(config=ext_config):
+                auxiliary_futures.append(self._submit_load_task(self._open_auxiliary_dataset, auxiliary_spec))
+
+        # load data
+        debug_time = time.time()
+        ds = load_dataset(dataset_spec)
+        timings["open"] = time.time() - debug_time
+
+        if ds is None:
+            raise ValueError(f"Dataset {dataset_id} not found")
+
+        debug_time = time.time()
+        auxiliary_times = [future.result() for future in auxiliary_futures]
+        timings["auxiliary_open"] = max(auxiliary_times, default=0.0)
+        timings["auxiliary_wait"] = time.time() - debug_time
+
+        # There is a better way to do this probably, but this works well and is very simple
+        debug_time = time.time()
+        for extension, ext_config in extensions:
+            logger.info(f"Applying extension {extension.name} to dataset {dataset_id}")
+            ds = extension.transform_dataset(ds=ds, config=ext_config)
+        timings["extensions"] = time.time() - debug_time
+
+        # save dataset to cache if caching is enabled
+        debug_time = time.time()
+        ds = self._add_dataset_to_cache(dataset_id, ds, lease=lease)
+        timings["cache"] = time.time() - debug_time
+
+        timings["total"] = time.time() - load_time
+        self.load_timings[dataset_id] = timings
+        logger.info(f"Loaded dataset for {dataset_id} in {timings['total']}s ({timings})")
+        return ds
+
+    # instantiates the extensions configured for a dataset, with their config
+    @staticmethod
+    def _get_dataset_extensions(dataset_id: str, dataset_spec: dict) -> list[tuple[DatasetExtension, dict]]:
+        extensions = []
+        for ext_name, ext_config in dataset_spec.get("extensions", {}).items():
+            extension = dataset_extension_manager.get_plugin(ext_name)
+            if extension is None:
+                logger.error(
+                    f"Could not find extension {ext_name} for dataset {dataset_id}"
+                )
+                continue
+            extensions.append((extension(), ext_config))
+        return extensions
+
+    # opens an auxiliary dataset into the static dataset store, returning how long it took.
+    # failures are left to the extension that uses the dataset to handle
+    @staticmethod
+    def _open_auxiliary_dataset(dataset_spec: dict) -> float:
+        start_time = time.time()
+        try:
+            static_dataset_store.get(dataset_spec)
+        except Exception as e:
+            logger.warning(f"Could not open auxiliary dataset {dataset_spec.get('path', '')}: {e}")
+        return time.time() - start_time
+
+    def _submit_load_task(self, fn, *args) -> Future:
+        if self.load_executor is None:
+            self.load_executor = ThreadPoolExecutor(
+                max_workers=settings.dataset_load_workers,
+                thread_name_prefix="xreds-load",
+            )
+        return self.load_executor.submit(fn, *args)
+
+    # loads the dataset mapping file using yaml, which can load json or yaml
+    # because yaml is a superset of json
+    @staticmethod
+    def _load_dataset_mapping() -> dict:
         try:
-            load_time = time.time()
-            debug_time = time.time()
+            with fsspec.open(settings.datasets_mapping_file, "r") as f:
+                return yaml.safe_load(f) or {}
+        except:
+            with fsspec.open(settings.datasets_mapping_file, "r", anon=True) as f:
+                return yaml.safe_load(f) or {}
 
-            # load data
-            dataset_spec = copy.deepcopy(self.dataset_mapping[dataset_id])
-            self._set_dataset_loading(dataset_id, True)
-            ds = load_dataset(dataset_spec)
+    # identifies the current version of the dataset mapping file from its ETag or modification time
+    @staticmethod
+    def _get_dataset_mapping_version() -> Optional[str]:
+        try:
+            fs, path = fsspec.core.url_to_fs(settings.datasets_mapping_file)
+            info = fs.info(path)
+        except:
+            fs, path = fsspec.core.url_to_fs(settings.datasets_mapping_file, anon=True)
+            info = fs.info(path)
 
-            if ds is None:
-                raise ValueError(f"Dataset {dataset_id} not found")
-            
-            logger.debug(f"Dataset {dataset_id} load time: {time.time() - debug_time}s")
-            debug_time = time.time()
-
-            # There is a better way to do this probably, but this works well and is very simple
-            extensions = dataset_spec.get("extensions", {})
-            for ext_name, ext_config in extensions.items():
-                extension = dataset_extension_manager.get_plugin(ext_name)
-                if extension is None:
-                    logger.error(
-                        f"Could not find extension {ext_name} for dataset {dataset_id}"
-                    )
+        return get_file_version(info)
+
+    # reloads the dataset mapping file, invalidating the cached datasets whose spec changed or
+    # that were removed, and returns the ids of the datasets that changed
+    def reload_dataset_mapping(self) -> list[str]:
+        dataset_mapping = self._load_dataset_mapping()
+        dataset_spec_hashes = {
+            dataset_id: hash_dataset_spec(spec) for dataset_id, spec in dataset_mapping.items()
+        }
+
+        changed = [
+            dataset_id
+            for dataset_id in set(self.dataset_spec_hashes.keys()).union(dataset_spec_hashes.keys())
+            if self.dataset_spec_hashes.get(dataset_id, None) != dataset_spec_hashes.get(dataset_id, None)
+        ]
+        previous_cache_keys = {dataset_id: self._get_dataset_cache_key(dataset_id) for dataset_id in changed}
+
+        self.dataset_mapping = dataset_mapping
+        self.dataset_spec_hashes = dataset_spec_hashes
+
+        for dataset_id in changed:
+            cache_key = previous_cache_keys[dataset_id]
+            self.cache_times.pop(cache_key, None)
+            self.memory_cache.pop(cache_key)
+            if self.redis_cache is not None:
+                self.redis_cache.delete(cache_key)
+            logger.info(f"Dataset spec for {dataset_id} changed, invalidated cached dataset")
+
+        return changed
+
+    # polls the dataset mapping file for changes every datasets_mapping_refresh_interval seconds
+    def _watch_dataset_mapping(self):
+        try:
+            version = self._get_dataset_mapping_version()
+        except Exception as e:
+            logger.warning(f"Could not get dataset mapping file version: {e}")
+            version = None
+
+        while True:
+            time.sleep(settings.datasets_mapping_refresh_interval)
+            try:
+                current_version = self._get_dataset_mapping_version()
+                # without a version to compare, reload every time - unchanged specs are not invalidated
+                if current_version is not None and current_version == version:
                     continue
-                else:
-                    logger.info(f"Applying extension {ext_name} to dataset {dataset_id}")
-                ds = extension().transform_dataset(ds=ds, config=ext_config)
-            
-            logger.debug(f"Dataset {dataset_id} extension time: {time.time() - debug_time}s")
-            logger.info(f"Loaded dataset for {dataset_id} in {time.time() - load_time}s")
 
-            # save dataset to cache if caching is enabled
-            self._add_dataset_to_cache(dataset_id, ds)
-            self._set_dataset_loading(dataset_id, False)
-            return ds
-        except:
-            self._set_dataset_loading(dataset_id, False)
-            raise
+                changed = self.reload_dataset_mapping()
+                version = current_version
+                if len(changed) > 0:
+                    logger.info(f"Reloaded dataset mapping file, {len(changed)} datasets changed")
+            except Exception as e:
+                logger.warning(f"Could not reload dataset mapping file: {e}")
+
+    # statistics for the caches of the current worker
+    def cache_stats(self) -> dict:
+        stats = {
+            "memory_cache": self.memory_cache.stats(),
+            "static_datasets": static_dataset_store.stats(),
+            "derived_data": derived_cache.stats(),
+            "subset_selections": subset_selection_cache.stats(),
+            "subset_reads": read_plan_stats.stats(),
+            "load_timings": dict(self.load_timings),
+        }
+        if settings.chunk_cache_dir or settings.use_redis_cache:
+            from xreds.chunk_cache import disk_chunk_cache_stats, redis_chunk_cache_stats
+            stats["chunk_cache"] = disk_chunk_cache_stats()
+            stats["redis_chunk_cache"] = redis_chunk_cache_stats()
+        return stats
 
     # loads a dataset from the cache
     #  - if memory caching is enabled -> checks first and loads from variable
     #  - if redis caching is enabled -> checks and then deserializes if exists
+    #  - if the cached dataset is expired but stale-while-revalidate is enabled -> returns the stale
+    #    dataset and refreshes it in the background, until it is older than dataset_max_stale_age
     #  - else -> return None
     def _load_dataset_from_cache(self, dataset_id: str):
         cache_key = self._get_dataset_cache_key(dataset_id)
@@ -117,123 +344,212 @@ class DatasetProvider(Plugin):
         if cache_key not in self.cache_times:
             self.cache_times[cache_key] = {
                 "expiration": datetime.now() + timedelta(seconds=settings.dataset_cache_timeout),
-                "requested": datetime.now()
             }
 
         # check if dataset is expired - if so refetch data
-        if datetime.now() > self.cache_times[cache_key]["expiration"]:
+        expiration = self.cache_times[cache_key]["expiration"]
+        if datetime.now() > expiration:
+            if self._is_within_max_stale_age(expiration):
+                stale_ds = self.memory_cache.get(cache_key)
+                if stale_ds is None:
+                    stale_ds, _ = self._load_dataset_from_redis(dataset_id)
+                if stale_ds is not None:
+                    logger.info(f"Cached dataset for {dataset_id} is stale, refreshing in the background...")
+                    self._schedule_dataset_refresh(dataset_id)
+                    return stale_ds
+
             del self.cache_times[cache_key]
-            if cache_key in self.memory_cache:
-                del self.memory_cache[cache_key]
+            self.memory_cache.pop(cache_key)
             if self.redis_cache is not None and self.redis_cache.exists(cache_key):
                 self.redis_cache.delete(cache_key)
 
             logger.info(f"Cached dataset for {dataset_id} is stale, reloading...")
             return None
-        else:
-            self.cache_times[cache_key]["requested"] = datetime.now()
         
         # load data from memory cache if exists
-        if cache_key in self.memory_cache:
+        ds = self.memory_cache.get(cache_key)
+        if ds is not None:
             logger.info(f"Using memory cached dataset for {dataset_id}")
-            return self.memory_cache[cache_key]
+            return ds
         
         # load data from redis cache if exists
-        if self.redis_cache is not None:
-            serialized_ds = self.redis_cache.get(cache_key)
-            if serialized_ds is not None:
-                start_time = time.time()
-                ds = pickle.loads(serialized_ds)
-                    
-                logger.debug(f"Using redis cached dataset for {dataset_id} (deserialization time: {time.time() - start_time}s)")
-                # if loaded from redis cache - add to memory cache for faster access
-                if settings.use_memory_cache and dataset_id not in self.memory_cache:
-                    self._add_dataset_to_memory_cache(dataset_id, ds)
+        ds, expiration = self._load_dataset_from_redis(dataset_id)
+        if ds is not None:
+            # if loaded from redis cache - add to memory cache for faster access
+            if settings.use_memory_cache and cache_key not in self.memory_cache:
+                ds = self._add_dataset_to_memory_cache(dataset_id, ds, expiration=expiration)
 
-                return ds
+            return ds
 
         logger.info(f"No dataset found in cache for {dataset_id}, loading...")
         return None
 
-    # adds fetched dataset to memory and/or redis cache
-    def _add_dataset_to_cache(self, dataset_id: str, ds: xr.Dataset):
+    # loads a dataset from the redis cache, returning it with the time it expires
+    def _load_dataset_from_redis(self, dataset_id: str) -> tuple[Optional[xr.Dataset], Optional[datetime]]:
+        if self.redis_cache is None:
+            return None, None
+
+        cache_key = self._get_dataset_cache_key(dataset_id)
+        pipeline = self.redis_cache.pipeline()
+        pipeline.get(cache_key)
+        pipeline.ttl(cache_key)
+        serialized_ds, ttl = pipeline.execute()
+        if serialized_ds is None:
+            return None, None
+
+        start_time = time.time()
+        try:
+            ds = deserialize_dataset(serialized_ds, spec_hash=self._get_dataset_spec_hash(dataset_id))
+        except SerializationError as e:
+            logger.warning(f"Could not deserialize redis cached dataset for {dataset_id}: {e}")
+            ds = None
+        if ds is None:
+            return None, None
+        logger.debug(f"Using redis cached dataset for {dataset_id} (deserialization time: {time.time() - start_time}s)")
+
+        # redis keeps datasets around for the max stale age past their expiration
+        expiration = None
+        if ttl is not None and ttl >= 0:
+            expiration = datetime.now() + timedelta(seconds=ttl - self._get_max_stale_seconds())
+        return ds, expiration
+
+    # loads a dataset from the redis cache only if it has not expired, adding it to the memory cache
+    def _load_fresh_dataset_from_redis(self, dataset_id: str) -> Optional[xr.Dataset]:
+        if self.redis_cache is None:
+            return None
+
+        # check the ttl first to avoid fetching a stale payload
+        ttl = self.redis_cache.ttl(self._get_dataset_cache_key(dataset_id))
+        if ttl is None or ttl - self._get_max_stale_seconds() <= 0:
+            return None
+
+        ds, expiration = self._load_dataset_from_redis(dataset_id)
+        if ds is None or expiration is None or expiration <= datetime.now():
+            return None
+
+        if settings.use_memory_cache:
+            ds = self._add_dataset_to_memory_cache(dataset_id, ds, expiration=expiration)
+        else:
+            self.cache_times[self._get_dataset_cache_key(dataset_id)] = {"expiration": expiration}
+        return ds
+
+    # adds fetched dataset to memory and/or redis cache, returning the dataset to use from now on
+    #  - if a load lease is provided, the redis cache is only written if the lease was not taken over
+    def _add_dataset_to_cache(self, dataset_id: str, ds: xr.Dataset, lease: Optional[RedisLease] = None) -> xr.Dataset:
         cache_key = self._get_dataset_cache_key(dataset_id)
 
         # add dataset to redis cache if enabled
         if self.redis_cache is not None:
             start_time = time.time()
-            serialized_ds = pickle.dumps(ds, protocol=-1)
-            self.redis_cache.set(cache_key, serialized_ds, ex=settings.dataset_cache_timeout)
-            logger.info(f"Redis cached dataset for {dataset_id} (serialization time: {time.time() - start_time}s)")
+            serialized_ds = serialize_dataset(
+                ds,
+                spec_hash=self._get_dataset_spec_hash(dataset_id),
+                compression=settings.redis_cache_compression,
+            )
+            expiry = settings.dataset_cache_timeout + self._get_max_stale_seconds()
+            if lease is None:
+                self.redis_cache.set(cache_key, serialized_ds, ex=expiry)
+            elif not lease.fenced_set(cache_key, serialized_ds, expiry):
+                logger.warning(f"Lost load lease for {dataset_id} to another worker, not updating redis cache")
+            logger.info(f"Redis cached dataset for {dataset_id} (serialization time: {time.time() - start_time}s, size: {len(serialized_ds)} bytes)")
         
         # also add dataset to memory cache if enabled
         if settings.use_memory_cache:
-            self._add_dataset_to_memory_cache(dataset_id, ds)
+            return self._add_dataset_to_memory_cache(dataset_id, ds)
+
+        self.cache_times[cache_key] = {
+            "expiration": datetime.now() + timedelta(seconds=settings.dataset_cache_timeout),
+        }
+        return ds
             
-    # adds a dataset to the memory cache, dropping the least recently accessed dataset
-    # if the current worker has already cached memory_cache_num_datasets datasets
-    def _add_dataset_to_memory_cache(self, dataset_id: str, ds: xr.Dataset):
+    # adds a dataset to the memory cache, dropping the least recently accessed datasets
+    # if the current worker is over its memory_cache_max_mb or memory_cache_num_datasets budget
+    #  - if shared arrays are enabled, static coordinates are swapped for arrays shared between workers
+    def _add_dataset_to_memory_cache(self, dataset_id: str, ds: xr.Dataset, expiration: Optional[datetime] = None) -> xr.Dataset:
         cache_key = self._get_dataset_cache_key(dataset_id)
+        pinned = self.dataset_mapping.get(dataset_id, {}).get("pin_in_memory", False)
 
-        # check if there's a limit of the number of datasets allowed in memory
-        if settings.memory_cache_num_datasets > 0:
-            diff = len(list(self.memory_cache.keys())) - (settings.memory_cache_num_datasets + 1)
-            if diff > 0:
-                for i in range(diff):
-                    oldest_key = None
-                    oldest_date = None
-                    for key, val in self.cache_times.items():
-                        if key == cache_key or key not in self.memory_cache:
-                            continue
-
-                        if oldest_key is None or val["requested"] < oldest_date:
-                            oldest_key = key
-                            oldest_date = val["requested"]
-
-                    if oldest_key is not None:
-                        del self.cache_times[oldest_key]
-                        del self.memory_cache[oldest_key]
-                        logger.info(f"Popped dataset {oldest_key} from memory cache")
-        
-        logger.info(f"Memory cached dataset for {dataset_id}")
-        self.memory_cache[cache_key] = ds
+        if self.shared_arrays is not None:
+            ds = self.shared_arrays.share_dataset(ds, self._get_dataset_spec_hash(dataset_id), owner=cache_key)
+
+        if self.memory_cache.put(cache_key, ds, pinned=pinned):
+            logger.info(f"Memory cached dataset for {dataset_id}")
+        elif self.shared_arrays is not None:
+            self.shared_arrays.release(cache_key)
         self.cache_times[cache_key] = {
-            "expiration": datetime.now() + timedelta(seconds=settings.dataset_cache_timeout),
-            "requested": datetime.now()
+            "expiration": expiration or datetime.now() + timedelta(seconds=settings.dataset_cache_timeout),
         }
+        return ds
+
+    # queues a background refresh of an expired dataset, unless a load of it is already running
+    # or the last background refresh failed recently
+    def _schedule_dataset_refresh(self, dataset_id: str):
+        cache_key = self._get_dataset_cache_key(dataset_id)
+        if self.single_flight.is_in_flight(cache_key):
+            return
+
+        failed_at = self.cache_times.get(cache_key, {}).get("refresh_failed", None)
+        if failed_at is not None and datetime.now() < failed_at + timedelta(seconds=self.refresh_retry_seconds):
+            return
+
+        if self.refresh_executor is None:
+            self.refresh_executor = ThreadPoolExecutor(
+                max_workers=settings.dataset_refresh_workers,
+                thread_name_prefix="xreds-refresh",
+            )
+        self.refresh_executor.submit(self._refresh_dataset, dataset_id)
+
+    # reloads an expired dataset and swaps it into the caches, while requests keep using the stale one
+    def _refresh_dataset(self, dataset_id: str):
+        flight_key = self._get_dataset_cache_key(dataset_id)
+        future, is_leader = self.single_flight.join(flight_key)
+        if not is_leader:
+            return
+
+        try:
+            # another worker may already be refreshing the dataset, or may have refreshed it already
+            ds = self._wait_or_load_dataset(dataset_id)
+
+            logger.info(f"Refreshed stale dataset {dataset_id} in the background")
+            future.set_result(ds)
+        except BaseException as e:
+            logger.error(f"Could not refresh stale dataset {dataset_id}: {e}")
+            cache_key = self._get_dataset_cache_key(dataset_id)
+            if cache_key in self.cache_times:
+                self.cache_times[cache_key]["refresh_failed"] = datetime.now()
+            future.set_exception(e)
+        finally:
+            self.single_flight.forget(flight_key, future)
 
-    # checks if a dataset is loading
-    def _is_dataset_loading(self, dataset_id: str):     
+    @staticmethod
+    def _get_max_stale_seconds() -> int:
+        if not settings.use_stale_while_revalidate:
+            return 0
+        return settings.dataset_max_stale_age
+
+    def _is_within_max_stale_age(self, expiration: datetime) -> bool:
+        if not settings.use_stale_while_revalidate:
+            return False
+        return datetime.now() <= expiration + timedelta(seconds=self._get_max_stale_seconds())
+
+    # checks if a worker holds the load lease of a dataset
+    def _is_dataset_loading(self, dataset_id: str):
         loading_key = self._get_loading_cache_key(dataset_id)
 
-        if loading_key in self.dataset_loading:
-            return True
         if self.redis_cache and self.redis_cache.exists(loading_key):
             return True
         
         return False
     
-    # sets the flag for a dataset loading in the memory and/or redis cache
-    def _set_dataset_loading(self, dataset_id: str, loading: bool):        
-        loading_key = self._get_loading_cache_key(dataset_id)
-
-        if loading:
-            if settings.use_memory_cache:
-                self.dataset_loading[loading_key] = True
-            if self.redis_cache is not None:
-                # assume datasets will take a maximum of 3 minutes to load
-                # TODO - figure out a way to clear redis if system crashed while loading
-                self.redis_cache.set(loading_key, "true", ex=180)
-        else:
-            if loading_key in self.dataset_loading:
-                del self.dataset_loading[loading_key]
-            if self.redis_cache is not None and self.redis_cache.exists(loading_key):
-                self.redis_cache.delete(loading_key)
-
-    @staticmethod
-    def _get_dataset_cache_key(dataset_id: str):
-        return f"dataset-{dataset_id}"
-
-    @staticmethod
-    def _get_loading_cache_key(dataset_id: str):
-        return f"loading-{dataset_id}"
+    def _get_dataset_spec_hash(self, dataset_id: str) -> str:
+        spec_hash = self.dataset_spec_hashes.get(dataset_id, None)
+        if spec_hash is None:
+            spec_hash = hash_dataset_spec(self.dataset_mapping.get(dataset_id, {}))
+        return spec_hash
+
+    # cache keys include the spec hash so datasets cached from a previous config are never used
+    def _get_dataset_cache_key(self, dataset_id: str):
+        return f"dataset-{dataset_id}-{self._get_dataset_spec_hash(dataset_id)}"
+
+    def _get_loading_cache_key(self, dataset_id: str):
+        return f"loading-{dataset_id}-{self._get_dataset_spec_hash(dataset_id)}"
@@ -1,16 +1,49 @@
+import asyncio
+import hashlib
+import inspect
+import json
 import os
-from typing import Optional, Union
-
+import tempfile
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Awaitable, Optional, Union
+
+import fsspec
 import icechunk
+import numpy as np
 import obstore as obs
+import pandas as pd
 import xarray as xr
 import zarr
-
+from pluggy import PluginManager
+from xarray_subset_grid.grids.ugrid import assign_ugrid_topology
+
+from xreds.config import settings
+from xreds.dataset_loader import (
+    DATASET_LOADER_PLUGIN_NAMESPACE,
+    DatasetLoader,
+    DatasetLoaderSpec,
+    hookimpl,
+    run_blocking,
+)
+from xreds.indexing import isel_contiguous
 from xreds.logging import logger
+from xreds.shared_arrays import connectivity_variable_names
+
+# time sort permutations of virtual icechunk aggregations, keyed by path and snapshot id
+TIME_ORDER_CACHE_SIZE = 64
+_time_order_cache: OrderedDict[str, Optional[np.ndarray]] = OrderedDict()
+_time_order_lock = threading.Lock()
+
+# positions kept by dimension masks, keyed by dataset spec, mask and the extent of the dimension
+MASK_INDEX_CACHE_SIZE = 64
+_mask_index_cache: OrderedDict[str, np.ndarray] = OrderedDict()
+_mask_index_lock = threading.Lock()
 
 def load_dataset(dataset_spec: dict) -> xr.Dataset | None:
-    """Load a dataset from a path"""
-    ds = None
+    """Load a dataset from a path, with the loader registered for its type"""
     dataset_path = dataset_spec.get("path", "")
     dataset_type = dataset_spec.get("type", None)
     if not dataset_type:
@@ -20,55 +53,31 @@ def load_dataset(dataset_spec: dict) -> xr.Dataset | None:
         logger.error(f"Could not infer dataset type for {dataset_path}")
         return None
 
-    chunks = dataset_spec.get("chunks", None)
-    drop_variables = dataset_spec.get("drop_variables", None)
+    # resolved before the loaders modify the storage options of the spec
+    chunk_cache = _get_chunk_cache_options(dataset_spec)
+
     mask_variables = dataset_spec.get("mask_variables", None)
+    mask_cache_key = hash_dataset_spec(dataset_spec) if mask_variables is not None else None
 
-    storage_options = dataset_spec.get("storage_options", {})
+    # not an fsspec option
+    dataset_spec.get("storage_options", {}).pop("redis_cache", None)
     additional_coords = dataset_spec.get("additional_coords", None)
     additional_attrs = dataset_spec.get("additional_attrs", None)
+    materialize_coords = dataset_spec.get("materialize_coords", False)
+    ugrid_topology = dataset_spec.get("ugrid_topology", None)
 
-    if dataset_type == "netcdf":
-        ds = _load_netcdf(
-            dataset_path,
-            engine=dataset_spec.get("engine", "netcdf4"),
-            chunks=chunks,
-            drop_variables=drop_variables
-        )
-    elif dataset_type == "grib2":
-        ds = _load_grib(
-            dataset_path,
-            chunks=chunks,
-            drop_variables=drop_variables
-        )
-    elif dataset_type == "kerchunk":
-        ds = _load_kerchunk(
-            dataset_path,
-            chunks=chunks,
-            drop_variables=drop_variables,
-            storage_options=storage_options
-        )
-    elif dataset_type == "zarr":
-        ds = _load_zarr(
-            dataset_path,
-            chunks=chunks,
-            drop_variables=drop_variables,
-            storage_options=storage_options
-        )
-    elif dataset_type == "zarr-obstore":
-        ds = _load_zarr_obstore(
-            dataset_path,
-            chunks=chunks,
-            drop_variables=drop_variables,
-            storage_options=storage_options
-        )
-    elif dataset_type == "virtual-icechunk":
-        ds = _load_virtual_icechunk(
-            dataset_path,
-            chunks=chunks,
-            drop_variables=drop_variables,
-            storage_options=storage_options
+    loader = dataset_loader_manager.get_plugin(dataset_type)
+    if loader is None:
+        logger.error(f"No loader registered for dataset type {dataset_type} of {dataset_path}")
+        return None
+
+    ds = _run_loader(
+        loader().open_dataset(
+            dataset_path=dataset_path,
+            dataset_spec=dataset_spec,
+            chunk_cache=chunk_cache
         )
+    )
 
     if ds is None:
         return None
@@ -81,11 +90,26 @@ def load_dataset(dataset_spec: dict) -> xr.Dataset | None:
     if additional_coords is not None:
         ds = ds.set_coords(additional_coords)
 
+    # Assign the declared mesh topology so subsets do not have to detect it
+    if ugrid_topology is not None:
+        try:
+            ds = assign_ugrid_topology(ds, **ugrid_topology)
+        except Exception as e:
+            logger.warning(f"Could not assign ugrid topology {ugrid_topology}: {e}")
+
+    # Load coordinates once so requests never read them from the remote store
+    if materialize_coords:
+        try:
+            ds = _materialize_coordinates(
+                ds,
+                dtypes=materialize_coords.get("dtypes", None) if isinstance(materialize_coords, dict) else None
+            )
+        except Exception as e:
+            logger.warning(f"Could not materialize coordinates: {e}")
+
     try:
         if ds.cf.coords["longitude"].dims[0] == "longitude":
-            ds = ds.assign_coords(
-                longitude=(((ds.longitude + 180) % 360) - 180)
-            ).sortby("longitude")
+            ds = _wrap_longitude(ds, "longitude")
             # TODO: Yeah this should not be assumed... but for regular grids we will viz with rioxarray so for now we will assume
             ds = ds.rio.write_crs(4326)
     except Exception as e:
@@ -107,23 +131,256 @@ def load_dataset(dataset_spec: dict) -> xr.Dataset | None:
 
     # mask variables by different variable in ds based on dataset_spec
     if mask_variables is not None:
-        for data_var, mask_var in mask_variables.items():
+        masked = set()
+        for target, mask_var in mask_variables.items():
             try:
-                curr_mask = ds[mask_var]
-                ds = ds.sel({mask_var: curr_mask})
-                ds = ds.drop(mask_var)
+                ds = _apply_mask(ds, target, mask_var, mask_cache_key)
+                masked.add(mask_var)
             except Exception as e:
-                logger.warning(f"Could not apply requested mask ({mask_var}) on ({data_var}): {e}")
+                logger.warning(f"Could not apply requested mask ({mask_var}) on ({target}): {e}")
+        ds = ds.drop_vars(masked.intersection(ds.variables))
 
     return ds
 
+def get_file_version(info: dict) -> Optional[str]:
+    """Version of a file from its fsspec info - its ETag or modification time"""
+    for key in ("ETag", "etag", "mtime", "LastModified", "last_modified"):
+        if key in info:
+            return str(info[key])
+    return None
+
+def hash_dataset_spec(dataset_spec: dict) -> str:
+    """Stable short hash of a dataset spec, used to tell apart datasets cached from different configs"""
+    serialized_spec = json.dumps(dataset_spec, sort_keys=True, default=str)
+    return hashlib.sha256(serialized_spec.encode()).hexdigest()[:16]
+
+def _wrap_longitude(ds: xr.Dataset, lon_dim: str) -> xr.Dataset:
+    """Wrap a longitude dimension to -180..180 and put it back in ascending order
+
+    A sorted 0..360 axis wraps into two sorted runs, so rather than sortby - which turns
+    every dask variable into a gather across all of its chunks - the dataset is reordered
+    by putting the second run first. Any selection then reads at most two contiguous slices
+    of the source chunks. Axes that do not wrap into two sorted runs fall back to sortby.
+    """
+    ds = ds.assign_coords({lon_dim: ((ds[lon_dim] + 180) % 360) - 180})
+    if ds.indexes[lon_dim].is_monotonic_increasing:
+        return ds
+
+    seams = np.flatnonzero(np.diff(ds[lon_dim].values) < 0)
+    if len(seams) == 1:
+        shift = int(seams[0]) + 1
+        rolled = isel_contiguous(ds, lon_dim, np.r_[shift:ds.sizes[lon_dim], 0:shift])
+        if rolled.indexes[lon_dim].is_monotonic_increasing:
+            return rolled
+
+    return ds.sortby(lon_dim)
+
+def _get_time_order(ds: xr.Dataset, time_dim: str, cache_key: str) -> Optional[np.ndarray]:
+    """Permutation that sorts a time dimension, None if it is already sorted
+
+    Cached by key, so the time coordinate of an aggregation is only checked once per version.
+    """
+    with _time_order_lock:
+        if cache_key in _time_order_cache:
+            _time_order_cache.move_to_end(cache_key)
+            return _time_order_cache[cache_key]
+
+    times = pd.Index(ds[time_dim].values)
+    order = None if times.is_monotonic_increasing else np.argsort(times.values, kind="stable")
+
+    with _time_order_lock:
+        _time_order_cache[cache_key] = order
+        while len(_time_order_cache) > TIME_ORDER_CACHE_SIZE:
+            _time_order_cache.popitem(last=False)
+    return order
+
+def _apply_mask(ds: xr.Dataset, target: str, mask_var: str, cache_key: str) -> xr.Dataset:
+    """Mask a data variable or dimension of a dataset by a boolean variable
+
+    Data variables are masked lazily with where, so the mask is only read with the data it
+    masks. Dimensions keep the positions where the mask is true, selected as contiguous runs
+    so the source chunks stay intact.
+    """
+    mask = ds[mask_var]
+    if target in ds.dims:
+        if mask.dims != (target,):
+            raise ValueError(f"Mask of dimension {target} must be along {target} only, not {mask.dims}")
+        return isel_contiguous(ds, target, _get_mask_index(ds, target, mask_var, cache_key))
+
+    if not set(mask.dims).issubset(ds[target].dims):
+        raise ValueError(f"Mask dimensions {mask.dims} are not dimensions of {target}")
+
+    # where on lazily indexed arrays would load them, so both sides are wrapped with dask
+    # using the chunks of the source store
+    data = ds[target]
+    if data.chunks is None:
+        data = data.chunk(data.encoding.get("preferred_chunks", {}))
+    if mask.chunks is None:
+        mask = mask.chunk(mask.encoding.get("preferred_chunks", {}))
+    return ds.assign({target: data.where(mask)})
+
+def _get_mask_index(ds: xr.Dataset, dim: str, mask_var: str, cache_key: str) -> np.ndarray:
+    """Positions along dim where a mask is true
+
+    Cached with the size and bounds of the dimension, so the mask is only read again when
+    the dimension changes.
+    """
+    index = ds.indexes.get(dim, None)
+    bounds = (index[0], index[-1]) if index is not None and len(index) > 0 else None
+    cache_key = f"{cache_key}-{mask_var}-{dim}-{ds.sizes[dim]}-{bounds}"
+
+    with _mask_index_lock:
+        if cache_key in _mask_index_cache:
+            _mask_index_cache.move_to_end(cache_key)
+            return _mask_index_cache[cache_key]
+
+    indexer = np.flatnonzero(np.asarray(ds[mask_var].values, dtype=bool))
+
+    with _mask_index_lock:
+        _mask_index_cache[cache_key] = indexer
+        while len(_mask_index_cache) > MASK_INDEX_CACHE_SIZE:
+            _mask_index_cache.popitem(last=False)
+    return indexer
+
+def _materialize_coordinates(ds: xr.Dataset, dtypes: Optional[dict] = None) -> xr.Dataset:
+    """Load the coordinate, index and mesh connectivity variables of a dataset into numpy arrays
+
+    dtypes optionally maps a source dtype to a smaller one to store the arrays as, e.g.
+    {"float64": "float32"}. Integers are only downcast when all of their values fit.
+    """
+    dtypes = dtypes or {}
+    coords = {}
+    data_vars = {}
+    for name in set(ds.coords).union(connectivity_variable_names(ds)):
+        var = ds.variables[name]
+        if var._in_memory and var.dtype.name not in dtypes:
+            continue
+
+        values = _downcast_array(np.asarray(var.values), dtypes)
+        if name in ds.coords:
+            coords[name] = var.copy(data=values)
+        else:
+            data_vars[name] = var.copy(data=values)
+
+    return ds.assign_coords(coords).assign(data_vars)
+
+def _downcast_array(values: np.ndarray, dtypes: dict) -> np.ndarray:
+    target_dtype = dtypes.get(values.dtype.name, None)
+    if target_dtype is None:
+        return values
+
+    target_dtype = np.dtype(target_dtype)
+    if np.issubdtype(target_dtype, np.integer):
+        if not np.issubdtype(values.dtype, np.integer):
+            return values
+        info = np.iinfo(target_dtype)
+        if values.size > 0 and (values.min() < info.min or values.max() > info.max):
+            return values
+    return values.astype(target_dtype)
+
+def _get_chunk_cache_options(dataset_spec: dict) -> Optional[dict]:
+    """Namespace and tiers of the chunk caches of a dataset, None if its chunks are not cached
+
+    disk: node local cache, enabled by CHUNK_CACHE_DIR unless the chunk_cache key of the spec disables it
+    redis: cache shared by all workers, enabled by the redis_cache key of the spec storage_options
+    """
+    chunk_cache_spec = dataset_spec.get("chunk_cache", None) or {}
+    redis_cache_spec = (dataset_spec.get("storage_options", None) or {}).get("redis_cache", None) or {}
+
+    disk_cache = None
+    if settings.chunk_cache_dir and chunk_cache_spec.get("enabled", True):
+        disk_cache = dict(
+            ttl=chunk_cache_spec.get("ttl", settings.chunk_cache_ttl),
+        )
+
+    redis_cache = None
+    if redis_cache_spec.get("enabled", len(redis_cache_spec) > 0):
+        if settings.use_redis_cache:
+            redis_cache = dict(
+                max_bytes=int(redis_cache_spec.get("max_mb", settings.redis_chunk_cache_max_mb) * 1024 * 1024),
+                ttl=redis_cache_spec.get("ttl", settings.chunk_cache_ttl),
+            )
+        else:
+            logger.warning("The redis chunk cache requires USE_REDIS_CACHE, not caching chunks in redis")
+
+    if disk_cache is None and redis_cache is None:
+        return None
+
+    if zarr.__version__ < "3.0.0":
+        logger.warning("Chunk caching requires zarr 3, not caching chunks")
+        return None
+
+    return dict(
+        namespace=hash_dataset_spec(dataset_spec),
+        disk=disk_cache,
+        redis=redis_cache,
+    )
+
+def _cache_store(store, chunk_cache: Optional[dict]):
+    if chunk_cache is None:
+        return store
+
+    # imported here since the wrapper store only exists in zarr 3
+    from xreds.chunk_cache import CachingStore, get_disk_chunk_cache, get_redis_chunk_cache
+
+    # the node local disk cache wraps the redis cache, so it is checked first and is
+    # filled from redis when another node already fetched the chunk
+    if chunk_cache["redis"] is not None:
+        store = CachingStore(
+            store,
+            get_redis_chunk_cache(chunk_cache["redis"]["max_bytes"]),
+            chunk_cache["namespace"],
+            ttl=chunk_cache["redis"]["ttl"],
+        )
+    if chunk_cache["disk"] is not None:
+        store = CachingStore(
+            store,
+            get_disk_chunk_cache(settings.chunk_cache_dir, settings.chunk_cache_max_mb * 1024 * 1024),
+            chunk_cache["namespace"],
+            ttl=chunk_cache["disk"]["ttl"],
+        )
+    return store
+
+def _reference_store(storage_options: dict):
+    """Zarr store reading through an fsspec ReferenceFileSystem"""
+    return zarr.storage.FsspecStore.from_url(
+        "reference://",
+        storage_options=storage_options,
+        read_only=True,
+    )
+
+def _run_loader(result: Union[xr.Dataset, Awaitable[xr.Dataset], None]) -> xr.Dataset | None:
+    if not inspect.isawaitable(result):
+        return result
+
+    if zarr.__version__ < "3.0.0":
+        return asyncio.run(result)
+
+    # run on zarr's event loop, which its stores and any fsspec filesystem they use are bound to
+    from zarr.core.sync import sync
+    return sync(result)
+
+async def _open_zarr_store(store, open_dataset=xr.open_dataset, **kwargs) -> xr.Dataset:
+    """Open a zarr store once the metadata of all of its arrays is fetched concurrently"""
+    if zarr.__version__ >= "3.0.0":
+        # imported here since the wrapper store only exists in zarr 3
+        from xreds.metadata_prefetch import prefetch_metadata
+        store = await prefetch_metadata(store)
+
+    return await run_blocking(open_dataset, store, **kwargs)
+
 def _infer_dataset_type(dataset_path: str) -> str:
-    if dataset_path.endswith(".nc"):
+    if dataset_path.endswith(".nc") and any(c in dataset_path for c in "*?["):
+        return "netcdf-aggregation"
+    elif dataset_path.endswith(".nc"):
         return "netcdf"
     elif dataset_path.endswith(".grib2"):
         return "grib2"
     elif dataset_path.endswith("json"):
         return "kerchunk"
+    elif dataset_path.rstrip("/").endswith((".parq", ".parquet")):
+        # kerchunk parquet reference store, loaded lazily by fsspec
+        return "kerchunk"
     elif dataset_path.endswith(".zarr"):
         return "zarr"
 
@@ -142,24 +399,138 @@ def _load_netcdf(
         drop_variables=drop_variables
     )
 
-# TODO: Network support?
 def _load_grib(
     dataset_path: str,
     chunks: Optional[str | dict],
     drop_variables: Optional[str | list[str]],
+    storage_options: dict,
+    use_references: bool = False,
+    concat_dims: Optional[list[str]] = None,
+    chunk_cache: Optional[dict] = None,
 ):
+    # cfgrib can only read local files, so remote files are always scanned into references
+    is_remote = not os.path.exists(dataset_path)
+    remote_options = storage_options.get("remote_options", {"anon": True}) if is_remote else {}
+
+    cache_dir = _get_grib_cache_dir()
+    cache_key = _get_grib_cache_key(dataset_path, remote_options)
+
+    if use_references or is_remote:
+        references_path = os.path.join(cache_dir, f"{cache_key}.json")
+        if not os.path.exists(references_path):
+            start_time = time.time()
+            references = _scan_grib_references(dataset_path, remote_options, concat_dims or ["step"])
+            tmp_path = f"{references_path}.{os.getpid()}-{uuid.uuid4().hex}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(references, f)
+            os.replace(tmp_path, references_path)
+            logger.info(f"Scanned grib2 references for {dataset_path} in {time.time() - start_time}s")
+
+        return _load_kerchunk(
+            references_path,
+            chunks=chunks,
+            drop_variables=drop_variables,
+            storage_options=dict(
+                remote_protocol=fsspec.utils.get_protocol(dataset_path),
+                remote_options=remote_options,
+            ) if is_remote else {},
+            chunk_cache=chunk_cache
+        )
+
     return xr.open_dataset(
         dataset_path,
         engine="cfgrib",
         chunks=chunks,
-        drop_variables=drop_variables
+        drop_variables=drop_variables,
+        backend_kwargs=dict(
+            indexpath=os.path.join(cache_dir, f"{cache_key}.{{short_hash}}.idx")
+        )
+    )
+
+def _get_grib_cache_dir() -> str:
+    cache_dir = settings.grib_cache_dir or os.path.join(tempfile.gettempdir(), "xreds-grib")
+    os.makedirs(cache_dir, exist_ok=True)
+    return cache_dir
+
+def _get_grib_cache_key(dataset_path: str, storage_options: dict) -> str:
+    """Hash of a grib2 file path and version, so its cached index is rebuilt when it changes"""
+    if os.path.exists(dataset_path):
+        version = str(os.path.getmtime(dataset_path))
+    else:
+        fs, path = fsspec.core.url_to_fs(dataset_path, **storage_options)
+        version = get_file_version(fs.info(path))
+    return hashlib.sha256(f"{dataset_path}-{version}".encode()).hexdigest()[:16]
+
+def _scan_grib_references(dataset_path: str, storage_options: dict, concat_dims: list[str]) -> dict:
+    """Scan the messages of a grib2 file into kerchunk references combined along concat_dims
+
+    Coordinates other than the concatenated dimensions and valid_time are taken from the
+    first message, so files mixing level types should be split into separate datasets.
+    """
+    # imported here since scanning grib2 needs cfgrib and eccodes
+    from kerchunk.combine import MultiZarrToZarr
+    from kerchunk.grib2 import scan_grib
+
+    messages = scan_grib(dataset_path, storage_options=storage_options)
+    if len(messages) == 1:
+        return messages[0]
+
+    coords = set()
+    for message in messages:
+        coords.update(json.loads(message["refs"].get(".zattrs", "{}")).get("coordinates", "").split())
+
+    return MultiZarrToZarr(
+        messages,
+        remote_protocol=fsspec.utils.get_protocol(dataset_path),
+        remote_options=storage_options,
+        concat_dims=concat_dims,
+        identical_dims=sorted(coords - set(concat_dims) - {"valid_time"}),
+    ).translate()
+
+def _load_netcdf_aggregation(
+    dataset_path: Union[str, list[str]],
+    chunks: Optional[str | dict],
+    drop_variables: Optional[str | list[str]],
+    storage_options: dict,
+    cache_key: str,
+    concat_dim: str = "time",
+    identical_dims: Optional[list[str]] = None,
+    chunk_cache: Optional[dict] = None,
+):
+    # imported here since the aggregation module uses the helpers of this module
+    from xreds.aggregation import NetCDFAggregation
+
+    paths = dataset_path if isinstance(dataset_path, list) else [dataset_path]
+    is_remote = fsspec.utils.get_protocol(paths[0]) != "file"
+    remote_options = storage_options.get("remote_options", {"anon": True}) if is_remote else {}
+
+    aggregation = NetCDFAggregation(
+        cache_dir=settings.netcdf_aggregation_cache_dir or os.path.join(tempfile.gettempdir(), "xreds-aggregations"),
+        cache_key=cache_key,
+        concat_dim=concat_dim,
+        identical_dims=identical_dims,
+        storage_options=remote_options,
+        max_workers=settings.netcdf_aggregation_workers,
+    )
+    references_path = aggregation.build(paths)
+
+    return _load_kerchunk(
+        references_path,
+        chunks=chunks,
+        drop_variables=drop_variables,
+        storage_options=dict(
+            remote_protocol=fsspec.utils.get_protocol(paths[0]),
+            remote_options=remote_options,
+        ) if is_remote else {},
+        chunk_cache=chunk_cache
     )
 
 def _load_kerchunk(
     dataset_path: str,
     chunks: Optional[str | dict],
     drop_variables: Optional[str | list[str]],
-    storage_options: dict
+    storage_options: dict,
+    chunk_cache: Optional[dict] = None,
 ):
     if not os.path.exists(dataset_path):
         storage_options["target_protocol"] = storage_options.get("target_protocol", "s3")
@@ -167,6 +538,19 @@ def _load_kerchunk(
         storage_options["remote_protocol"] = storage_options.get("remote_protocol", "s3")
         storage_options["remote_options"] = storage_options.get("remote_options", {"anon": True})
 
+    if chunk_cache is not None:
+        # open the references as a zarr store so chunk reads can go through the disk cache
+        reference_options = {**storage_options, "fo": dataset_path}
+        if "remote_options" in reference_options:
+            reference_options["remote_options"] = {**reference_options["remote_options"], "asynchronous": True}
+        return xr.open_dataset(
+            _cache_store(_reference_store(reference_options), chunk_cache),
+            engine="zarr",
+            chunks=chunks,
+            drop_variables=drop_variables,
+            backend_kwargs=dict(consolidated=False)
+        )
+
     return xr.open_dataset(
         dataset_path,
         engine="kerchunk",
@@ -178,15 +562,17 @@ def _load_kerchunk(
         )
     )
 
-def _load_zarr(
+async def _load_zarr(
     dataset_path: str,
     chunks: Optional[str | dict],
     drop_variables: Optional[str | list[str]],
     storage_options: dict,
+    chunk_cache: Optional[dict] = None,
 ):
+    is_zarr_2 = zarr.__version__ < "3.0.0"
     if os.path.exists(dataset_path):
-        return xr.open_dataset(
-            dataset_path,
+        return await _open_zarr_store(
+            dataset_path if is_zarr_2 else zarr.storage.LocalStore(dataset_path, read_only=True),
             engine="zarr",
             chunks=chunks,
             drop_variables=drop_variables,
@@ -202,28 +588,40 @@ def _load_zarr(
             "remote_options": storage_options.get("remote_options", {"anon": True})
         }
 
-        is_zarr_2 = zarr.__version__ < "3.0.0"
         if "remote_options" in storage_options:
             storage_options["remote_options"]["asynchronous"] = not is_zarr_2
         else:
             storage_options["remote_options"] = {"asynchronous": not is_zarr_2}
 
-        return xr.open_dataset(
-            "reference://",
+        if is_zarr_2:
+            return await run_blocking(
+                xr.open_dataset,
+                "reference://",
+                engine="zarr",
+                chunks=chunks,
+                drop_variables=drop_variables,
+                backend_kwargs=dict(
+                    consolidated=False,
+                    storage_options=storage_options,
+                )
+            )
+
+        # the references are read when the filesystem is created
+        store = await run_blocking(_reference_store, storage_options)
+        return await _open_zarr_store(
+            _cache_store(store, chunk_cache),
             engine="zarr",
             chunks=chunks,
             drop_variables=drop_variables,
-            backend_kwargs=dict(
-                consolidated=False,
-                storage_options=storage_options,
-            )
+            backend_kwargs=dict(consolidated=False)
         )
 
-def _load_zarr_obstore(
+async def _load_zarr_obstore(
     dataset_path: str,
     chunks: Optional[str | dict],
     drop_variables: Optional[str | list[str]],
     storage_options: dict,
+    chunk_cache: Optional[dict] = None,
 ):
 
     if os.path.exists(dataset_path):
@@ -234,8 +632,12 @@ def _load_zarr_obstore(
             skip_signature=True,
         )
 
-    return xr.open_dataset(
-        zarr.storage.ObjectStore(store),
+    # local stores are already on disk, only cache chunks fetched from object storage
+    if os.path.exists(dataset_path):
+        chunk_cache = None
+
+    return await _open_zarr_store(
+        _cache_store(zarr.storage.ObjectStore(store), chunk_cache),
         engine="zarr",
         chunks=chunks,
         drop_variables=drop_variables,
@@ -243,19 +645,14 @@ def _load_zarr_obstore(
         backend_kwargs=dict(consolidated=False)
     )
 
-def _load_virtual_icechunk(
-    dataset_path: str,
-    chunks: Optional[str | dict],
-    drop_variables: Optional[str | list[str]],
-    storage_options: dict,
-):
+def _open_icechunk_session(dataset_path: str, storage_options: dict) -> icechunk.Session:
     ic_creds = None
     ic_config = icechunk.RepositoryConfig.default()
     if "virtual_chunk_container" in storage_options:
         chunk_params = storage_options.pop("virtual_chunk_container", {})
         if chunk_params.get("type", "s3").lower() == "s3":
             store = chunk_params.get("store", {})
-            print('Store: ', store)
+            logger.debug(f"Virtual chunk container store: {store}")
             ic_config.set_virtual_chunk_container(
                 icechunk.VirtualChunkContainer(
                     url_prefix=store.get("path", ""),
@@ -299,8 +696,24 @@ def _load_virtual_icechunk(
                   else "master" if "master" in all_branches
                   else all_branches[0])
 
-    ds = xr.open_zarr(
-        repo.readonly_session(branch).store,
+    return repo.readonly_session(branch)
+
+async def _load_virtual_icechunk(
+    dataset_path: str,
+    chunks: Optional[str | dict],
+    drop_variables: Optional[str | list[str]],
+    storage_options: dict,
+    chunk_cache: Optional[dict] = None,
+):
+    # opening the repository makes blocking requests, keep them off of the event loop
+    session = await run_blocking(_open_icechunk_session, dataset_path, storage_options)
+    if chunk_cache is not None:
+        # commits to the branch can rewrite chunks, so chunks are cached per snapshot
+        chunk_cache = {**chunk_cache, "namespace": f"{chunk_cache['namespace']}-{session.snapshot_id}"}
+
+    ds = await _open_zarr_store(
+        _cache_store(session.store, chunk_cache),
+        open_dataset=xr.open_zarr,
         chunks=chunks,
         drop_variables=drop_variables,
         consolidated=False,
@@ -308,11 +721,131 @@ def _load_virtual_icechunk(
     )
 
     # sort time (temporary? fix for possible out-of-order time dim in aggregations)
+    # the order only changes with a new snapshot, and already sorted aggregations are left untouched
     try:
         time_dim = ds.cf["time"].dims[0]
         if time_dim:
-            return ds.sortby(time_dim)
+            order = _get_time_order(ds, time_dim, f"{dataset_path}-{session.snapshot_id}")
+            if order is not None:
+                return isel_contiguous(ds, time_dim, order)
     except Exception as e:
         logger.warning(f"Could not sort time for virtual_icechunk dataset {dataset_path}: {e}")
 
     return ds
+
+
+class NetCDFLoader(DatasetLoader):
+    name: str = "netcdf"
+
+    @hookimpl
+    def open_dataset(self, dataset_path: str, dataset_spec: dict, chunk_cache: Optional[dict]) -> xr.Dataset:
+        return _load_netcdf(
+            dataset_path,
+            engine=dataset_spec.get("engine", "netcdf4"),
+            chunks=dataset_spec.get("chunks", None),
+            drop_variables=dataset_spec.get("drop_variables", None)
+        )
+
+
+class NetCDFAggregationLoader(DatasetLoader):
+    name: str = "netcdf-aggregation"
+
+    @hookimpl
+    def open_dataset(self, dataset_path: str, dataset_spec: dict, chunk_cache: Optional[dict]) -> xr.Dataset:
+        return _load_netcdf_aggregation(
+            dataset_spec.get("paths", dataset_path),
+            chunks=dataset_spec.get("chunks", None),
+            drop_variables=dataset_spec.get("drop_variables", None),
+            storage_options=dataset_spec.get("storage_options", {}),
+            cache_key=hash_dataset_spec(dataset_spec),
+            concat_dim=dataset_spec.get("concat_dim", "time"),
+            identical_dims=dataset_spec.get("identical_dims", None),
+            chunk_cache=chunk_cache
+        )
+
+
+class GribLoader(DatasetLoader):
+    name: str = "grib2"
+
+    @hookimpl
+    def open_dataset(self, dataset_path: str, dataset_spec: dict, chunk_cache: Optional[dict]) -> xr.Dataset:
+        return _load_grib(
+            dataset_path,
+            chunks=dataset_spec.get("chunks", None),
+            drop_variables=dataset_spec.get("drop_variables", None),
+            storage_options=dataset_spec.get("storage_options", {}),
+            use_references=dataset_spec.get("grib_references", False),
+            concat_dims=dataset_spec.get("grib_concat_dims", None),
+            chunk_cache=chunk_cache
+        )
+
+
+class KerchunkLoader(DatasetLoader):
+    name: str = "kerchunk"
+
+    @hookimpl
+    def open_dataset(self, dataset_path: str, dataset_spec: dict, chunk_cache: Optional[dict]) -> xr.Dataset:
+        return _load_kerchunk(
+            dataset_path,
+            chunks=dataset_spec.get("chunks", None),
+            drop_variables=dataset_spec.get("drop_variables", None),
+            storage_options=dataset_spec.get("storage_options", {}),
+            chunk_cache=chunk_cache
+        )
+
+
+class ZarrLoader(DatasetLoader):
+    name: str = "zarr"
+
+    @hookimpl
+    async def open_dataset(self, dataset_path: str, dataset_spec: dict, chunk_cache: Optional[dict]) -> xr.Dataset:
+        return await _load_zarr(
+            dataset_path,
+            chunks=dataset_spec.get("chunks", None),
+            drop_variables=dataset_spec.get("drop_variables", None),
+            storage_options=dataset_spec.get("storage_options", {}),
+            chunk_cache=chunk_cache
+        )
+
+
+class ZarrObstoreLoader(DatasetLoader):
+    name: str = "zarr-obstore"
+
+    @hookimpl
+    async def open_dataset(self, dataset_path: str, dataset_spec: dict, chunk_cache: Optional[dict]) -> xr.Dataset:
+        return await _load_zarr_obstore(
+            dataset_path,
+            chunks=dataset_spec.get("chunks", None),
+            drop_variables=dataset_spec.get("drop_variables", None),
+            storage_options=dataset_spec.get("storage_options", {}),
+            chunk_cache=chunk_cache
+        )
+
+
+class VirtualIcechunkLoader(DatasetLoader):
+    name: str = "virtual-icechunk"
+
+    @hookimpl
+    async def open_dataset(self, dataset_path: str, dataset_spec: dict, chunk_cache: Optional[dict]) -> xr.Dataset:
+        return await _load_virtual_icechunk(
+            dataset_path,
+            chunks=dataset_spec.get("chunks", None),
+            drop_variables=dataset_spec.get("drop_variables", None),
+            storage_options=dataset_spec.get("storage_options", {}),
+            chunk_cache=chunk_cache
+        )
+
+
+dataset_loader_manager = PluginManager(DATASET_LOADER_PLUGIN_NAMESPACE)
+dataset_loader_manager.add_hookspecs(DatasetLoaderSpec)
+dataset_loader_manager.register(NetCDFLoader, name="netcdf")
+dataset_loader_manager.register(NetCDFAggregationLoader, name="netcdf-aggregation")
+dataset_loader_manager.register(GribLoader, name="grib2")
+dataset_loader_manager.register(KerchunkLoader, name="kerchunk")
+dataset_loader_manager.register(ZarrLoader, name="zarr")
+dataset_loader_manager.register(ZarrObstoreLoader, name="zarr-obstore")
+dataset_loader_manager.register(VirtualIcechunkLoader, name="virtual-icechunk")
+
+# loaders for other dataset types, registered by installed packages under the
+# xreds_dataset_loader entry point group with the dataset type as their name
+dataset_loader_manager.load_setuptools_entrypoints(DATASET_LOADER_PLUGIN_NAMESPACE)
@@ -0,0 +1,82 @@
+import itertools
+import threading
+import weakref
+from typing import Callable, TypeVar
+
+import xarray as xr
+
+from xreds.singleflight import SingleFlight
+
+
+T = TypeVar("T")
+
+
+class DerivedDataCache:
+    """Values derived from opened datasets, like spatial indexes, kept as long as the dataset
+
+    Entries are attached to the dataset object, so they are built once for every dataset held
+    in the memory cache and dropped once a dataset is evicted or reloaded and garbage collected.
+    Concurrent requests for the same missing entry share a single build.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries: dict[int, dict[str, object]] = {}
+        self._single_flight = SingleFlight()
+
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, ds: xr.Dataset, key: str, build: Callable[[], T]) -> T:
+        ds_id = id(ds)
+        with self._lock:
+            entries = self._entries.get(ds_id, None)
+            if entries is not None and key in entries:
+                self.hits += 1
+                return entries[key]
+            self.misses += 1
+
+        future, is_leader = self._single_flight.join(f"{ds_id}-{key}")
+        if not is_leader:
+            return future.result()
+
+        try:
+            value = build()
+            with self._lock:
+                if ds_id not in self._entries:
+                    self._entries[ds_id] = {}
+                    # ids are only reused once the dataset is collected, which drops its entries
+                    weakref.finalize(ds, self._discard, ds_id)
+                self._entries[ds_id][key] = value
+            future.set_result(value)
+            return value
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            self._single_flight.forget(f"{ds_id}-{key}", future)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "datasets": len(self._entries),
+                "entries": sum(len(entries) for entries in self._entries.values()),
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+    def _discard(self, ds_id: int):
+        with self._lock:
+            self._entries.pop(ds_id, None)
+
+
+derived_cache = DerivedDataCache()
+
+
+_generations = itertools.count()
+
+
+def dataset_generation(ds: xr.Dataset) -> int:
+    """Number unique to a dataset object, so values derived from it can be cached elsewhere
+    without being reused for a reloaded version of the dataset"""
+    return derived_cache.get(ds, "generation", lambda: next(_generations))
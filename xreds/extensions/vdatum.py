@@ -1,11 +1,9 @@
 from typing import Literal
 import xarray as xr
 
-from xreds.config import settings
 from xreds.dataset_extension import DatasetExtension, hookimpl
 from xreds.logging import logger
-from xreds.redis import get_redis_cache
-from xreds.dataset_utils import load_dataset
+from xreds.static_datasets import static_dataset_store
 
 
 def transform_datum(
@@ -55,6 +53,14 @@ class VDatumTransformationExtension(DatasetExtension):
 
     name: str = "vdatum"
 
+    @hookimpl
+    def auxiliary_datasets(self, config: dict) -> list[dict]:
+        """The vdatum grid, opened through the static dataset store"""
+        vdatum_file = config.get("path", None)
+        if vdatum_file is None:
+            return []
+        return [{"path": vdatum_file}]
+
     @hookimpl
     def transform_dataset(self, ds: xr.Dataset, config: dict) -> xr.Dataset:
         """Transform a dataset"""
@@ -71,8 +77,7 @@ class VDatumTransformationExtension(DatasetExtension):
             )
             return ds
 
-        redis_cache = get_redis_cache()
-        ds_vdatum = load_dataset({"path": vdatum_file})
+        ds_vdatum = static_dataset_store.get({"path": vdatum_file})
         if ds_vdatum is None:
             logger.warning(
                 f"Could not load vdatum dataset from {vdatum_file}. Skipping vdatum transformation"
@@ -0,0 +1,52 @@
+import numpy as np
+import xarray as xr
+
+
+# beyond this many runs concatenating slices costs more than a plain fancy index
+MAX_CONTIGUOUS_RUNS = 64
+
+
+def contiguous_runs(indexer: np.ndarray) -> list[slice]:
+    """Split an integer indexer into slices of consecutive ascending positions"""
+    indexer = np.asarray(indexer)
+    if indexer.size == 0:
+        return []
+
+    breaks = np.flatnonzero(np.diff(indexer) != 1) + 1
+    starts = np.concatenate(([0], breaks))
+    ends = np.concatenate((breaks, [indexer.size]))
+    return [slice(int(indexer[start]), int(indexer[end - 1]) + 1) for start, end in zip(starts, ends)]
+
+
+def is_dask_backed(ds: xr.Dataset, dim: str) -> bool:
+    """Whether every non index variable along dim is a dask array"""
+    return all(
+        var.chunks is not None
+        for name, var in ds.variables.items()
+        if dim in var.dims and name not in ds.xindexes
+    )
+
+
+def isel_contiguous(ds: xr.Dataset, dim: str, indexer: np.ndarray) -> xr.Dataset:
+    """Select positions along dim, reading them as contiguous runs when possible
+
+    A fancy index turns dask variables into a gather across every chunk it touches, so
+    when the indexer is made of a few ascending runs, dask datasets are instead built by
+    concatenating one slice per run, which keeps the source chunks intact. Lazily indexed
+    datasets are indexed directly since concatenating them would load them.
+    """
+    runs = contiguous_runs(indexer)
+    if len(runs) == 1:
+        return ds.isel({dim: runs[0]})
+
+    if len(runs) == 0 or len(runs) > MAX_CONTIGUOUS_RUNS or not is_dask_backed(ds, dim):
+        return ds.isel({dim: np.asarray(indexer)})
+
+    return xr.concat(
+        [ds.isel({dim: run}) for run in runs],
+        dim=dim,
+        data_vars="minimal",
+        coords="minimal",
+        compat="override",
+        join="override",
+    )
@@ -0,0 +1,133 @@
+import threading
+import uuid
+from typing import Optional
+
+import redis
+
+from xreds.logging import logger
+
+
+# fencing counters outlive the lease by this multiple of its ttl, so a counter is only dropped
+# long after any owner that could still write with one of its tokens is gone
+FENCE_TTL_MULTIPLE = 100
+
+# increments the fencing counter, keeping it only as long as it can be used
+ACQUIRE_FENCE_SCRIPT = """
+local token = redis.call('incr', KEYS[1])
+redis.call('pexpire', KEYS[1], ARGV[1])
+return token
+"""
+
+# renews the lease and its fencing counter only if the lease is still held by this owner
+RENEW_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    redis.call('pexpire', KEYS[2], ARGV[3])
+    return redis.call('pexpire', KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+# releases the lease only if it is still held by this owner
+RELEASE_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+# writes a value only if no newer owner has acquired the lease since this owner did
+FENCED_SET_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('set', KEYS[2], ARGV[2], 'EX', ARGV[3])
+end
+return nil
+"""
+
+
+class RedisLease:
+    """A lease on a redis key shared between workers
+
+    The key holds a random owner token and expires after ttl seconds unless it is renewed,
+    which a heartbeat thread does every ttl / 3 seconds while the lease is held. When the
+    owner dies its lease expires quickly and another worker can take it over.
+
+    Every acquisition increments a fencing counter, and writes made through fenced_set are
+    rejected once a newer owner has acquired the lease, so a worker that lost its lease
+    (e.g. paused past the ttl) can not overwrite the result of the worker that took over.
+    The counter expires FENCE_TTL_MULTIPLE lease ttls after the lease was last acquired or
+    renewed, so counters of dataset specs that are no longer loaded do not pile up in redis.
+    """
+
+    def __init__(self, redis_cache: redis.Redis, key: str, ttl: float = 30):
+        self.redis_cache = redis_cache
+        self.key = key
+        self.fence_key = f"fence-{key}"
+        self.ttl = ttl
+        self.token = uuid.uuid4().hex
+        self.fencing_token: Optional[int] = None
+
+        self._lost = threading.Event()
+        self._stopped = threading.Event()
+        self._heartbeat: Optional[threading.Thread] = None
+
+    @property
+    def is_held(self) -> bool:
+        return self.fencing_token is not None and not self._lost.is_set() and not self._stopped.is_set()
+
+    def acquire(self) -> bool:
+        """Try to acquire the lease without blocking"""
+        acquired = self.redis_cache.set(self.key, self.token, nx=True, px=int(self.ttl * 1000))
+        if not acquired:
+            return False
+
+        self.fencing_token = int(
+            self.redis_cache.eval(ACQUIRE_FENCE_SCRIPT, 1, self.fence_key, self._get_fence_ttl_ms())
+        )
+        self._heartbeat = threading.Thread(
+            target=self._run_heartbeat,
+            name=f"xreds-lease-{self.key}",
+            daemon=True,
+        )
+        self._heartbeat.start()
+        return True
+
+    def renew(self) -> bool:
+        """Extend the lease by ttl seconds, returns False if the lease is no longer held"""
+        renewed = self.redis_cache.eval(
+            RENEW_SCRIPT, 2, self.key, self.fence_key, self.token, int(self.ttl * 1000), self._get_fence_ttl_ms()
+        )
+        if not renewed:
+            self._lost.set()
+        return bool(renewed)
+
+    def release(self):
+        self._stopped.set()
+        if self._heartbeat is not None:
+            self._heartbeat.join()
+            self._heartbeat = None
+
+        try:
+            self.redis_cache.eval(RELEASE_SCRIPT, 1, self.key, self.token)
+        except redis.RedisError as e:
+            logger.warning(f"Could not release lease {self.key}, it will expire in {self.ttl}s: {e}")
+
+    def fenced_set(self, key: str, value: bytes, ex: int) -> bool:
+        """Set key to value only if no other owner has acquired the lease since this one"""
+        if self.fencing_token is None:
+            return False
+        written = self.redis_cache.eval(
+            FENCED_SET_SCRIPT, 2, self.fence_key, key, self.fencing_token, value, ex
+        )
+        return written is not None
+
+    def _get_fence_ttl_ms(self) -> int:
+        return int(self.ttl * FENCE_TTL_MULTIPLE * 1000)
+
+    def _run_heartbeat(self):
+        while not self._stopped.wait(self.ttl / 3):
+            try:
+                if not self.renew():
+                    logger.warning(f"Lost lease {self.key}, another worker may take over")
+                    return
+            except redis.RedisError as e:
+                logger.warning(f"Could not renew lease {self.key}: {e}")
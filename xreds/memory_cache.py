@@ -0,0 +1,178 @@
+import threading
+from collections import OrderedDict
+from typing import Callable, Optional
+
+import xarray as xr
+
+from xreds.logging import logger
+from xreds.shared_arrays import is_shared_array
+
+
+def dataset_memory_footprint(ds: xr.Dataset) -> int:
+    """Estimate the number of bytes a dataset holds in worker memory
+
+    Only data that is already loaded is counted - lazily indexed and dask backed
+    variables cost next to nothing until they are read, and arrays memory mapped from
+    the shared array store are held once per node. Indexes are counted once from
+    their pandas representation.
+    """
+    footprint = 0
+
+    indexed_names = set(ds.xindexes.keys())
+    for index in ds.xindexes.get_unique():
+        pd_index = getattr(index, "index", None)
+        if pd_index is not None:
+            footprint += int(pd_index.memory_usage())
+
+    for name, var in ds.variables.items():
+        if name in indexed_names:
+            continue
+        if var._in_memory and not is_shared_array(var._data):
+            footprint += int(var.nbytes)
+
+    return footprint
+
+
+class DatasetMemoryCache:
+    """LRU cache of opened datasets bounded by a byte budget and/or a number of datasets
+
+    Recency is tracked with an OrderedDict so lookups, inserts and each eviction are O(1).
+    Pinned datasets are kept outside of the LRU order and are never evicted, but their
+    size still counts towards the budget.
+    """
+
+    def __init__(
+        self,
+        max_bytes: int = 0,
+        max_items: int = 0,
+        on_evict: Optional[Callable[[str], None]] = None,
+    ):
+        # 0 = unlimited
+        self.max_bytes = max_bytes
+        self.max_items = max_items
+        # called with the key of every dataset evicted or popped from the cache
+        self.on_evict = on_evict
+
+        self._lock = threading.RLock()
+        self._lru: OrderedDict[str, tuple[xr.Dataset, int]] = OrderedDict()
+        self._pinned: dict[str, tuple[xr.Dataset, int]] = {}
+        self._current_bytes = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.evicted_bytes = 0
+        self.rejections = 0
+
+    def __contains__(self, key: str) -> bool:
+        with self._lock:
+            return key in self._lru or key in self._pinned
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._lru) + len(self._pinned)
+
+    def get(self, key: str) -> Optional[xr.Dataset]:
+        with self._lock:
+            entry = self._pinned.get(key, None)
+            if entry is None:
+                entry = self._lru.get(key, None)
+                if entry is not None:
+                    self._lru.move_to_end(key)
+
+            if entry is None:
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key: str, ds: xr.Dataset, pinned: bool = False) -> bool:
+        """Add a dataset to the cache, evicting the least recently used datasets until
+        it fits. Returns False if the dataset can never fit in the budget"""
+        nbytes = dataset_memory_footprint(ds)
+
+        with self._lock:
+            self._remove(key)
+
+            if not pinned and self.max_bytes > 0 and nbytes > self.max_bytes:
+                self.rejections += 1
+                logger.warning(
+                    f"Dataset {key} ({nbytes} bytes) is larger than the memory cache budget ({self.max_bytes} bytes), not caching"
+                )
+                return False
+
+            if pinned:
+                self._pinned[key] = (ds, nbytes)
+            else:
+                self._lru[key] = (ds, nbytes)
+            self._current_bytes += nbytes
+
+            evicted = self._evict()
+
+        if self.on_evict is not None:
+            for evicted_key in evicted:
+                self.on_evict(evicted_key)
+        return True
+
+    def pop(self, key: str) -> Optional[xr.Dataset]:
+        with self._lock:
+            entry = self._remove(key)
+        if entry is None:
+            return None
+
+        if self.on_evict is not None:
+            self.on_evict(key)
+        return entry[0]
+
+    def clear(self):
+        with self._lock:
+            keys = [*self._lru.keys(), *self._pinned.keys()]
+            self._lru.clear()
+            self._pinned.clear()
+            self._current_bytes = 0
+
+        if self.on_evict is not None:
+            for key in keys:
+                self.on_evict(key)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "datasets": len(self._lru) + len(self._pinned),
+                "pinned_datasets": len(self._pinned),
+                "current_bytes": self._current_bytes,
+                "max_bytes": self.max_bytes,
+                "max_datasets": self.max_items,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "evicted_bytes": self.evicted_bytes,
+                "rejections": self.rejections,
+            }
+
+    def _remove(self, key: str) -> Optional[tuple[xr.Dataset, int]]:
+        entry = self._lru.pop(key, None)
+        if entry is None:
+            entry = self._pinned.pop(key, None)
+        if entry is not None:
+            self._current_bytes -= entry[1]
+        return entry
+
+    def _is_over_budget(self) -> bool:
+        if self.max_bytes > 0 and self._current_bytes > self.max_bytes:
+            return True
+        if self.max_items > 0 and len(self._lru) + len(self._pinned) > self.max_items:
+            return True
+        return False
+
+    def _evict(self) -> list[str]:
+        evicted = []
+        while self._is_over_budget() and len(self._lru) > 0:
+            key, (_, nbytes) = self._lru.popitem(last=False)
+            self._current_bytes -= nbytes
+            self.evictions += 1
+            self.evicted_bytes += nbytes
+            evicted.append(key)
+            logger.info(f"Popped dataset {key} ({nbytes} bytes) from memory cache")
+        return evicted
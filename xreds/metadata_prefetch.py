@@ -0,0 +1,83 @@
+import asyncio
+from typing import Optional
+
+from zarr.abc.store import ByteRequest, Store
+from zarr.core.buffer import Buffer, BufferPrototype, default_buffer_prototype
+from zarr.storage import WrapperStore
+
+from xreds.logging import logger
+
+
+ZARR_V3_METADATA_KEYS = ("zarr.json",)
+ZARR_V2_METADATA_KEYS = (".zarray", ".zattrs", ".zgroup")
+
+# maximum number of metadata documents requested at once
+MAX_CONCURRENT_FETCHES = 32
+
+
+class PrefetchedMetadataStore(WrapperStore[Store]):
+    """Zarr store wrapper serving metadata documents that were fetched up front
+
+    Opening an unconsolidated group reads the metadata of every array one at a time, which
+    adds up to one round trip per variable on object storage. Fetching them all concurrently
+    beforehand lets the open itself run from memory.
+    """
+
+    def __init__(self, store: Store, metadata: Optional[dict[str, Optional[bytes]]] = None):
+        super().__init__(store)
+        # None marks documents that do not exist in the store
+        self.metadata = metadata or {}
+
+    def _with_store(self, store: Store) -> "PrefetchedMetadataStore":
+        return type(self)(store, self.metadata)
+
+    async def get(
+        self,
+        key: str,
+        prototype: BufferPrototype,
+        byte_range: Optional[ByteRequest] = None,
+    ) -> Optional[Buffer]:
+        if byte_range is None and key in self.metadata:
+            data = self.metadata[key]
+            return None if data is None else prototype.buffer.from_bytes(data)
+        return await self._store.get(key, prototype, byte_range)
+
+    async def exists(self, key: str) -> bool:
+        if key in self.metadata:
+            return self.metadata[key] is not None
+        return await self._store.exists(key)
+
+    def __repr__(self) -> str:
+        return f"PrefetchedMetadataStore({self._store!r})"
+
+
+async def prefetch_metadata(store: Store) -> Store:
+    """Fetch the metadata of a group and all of its arrays concurrently, returning a store
+    that serves them from memory. The store is returned as is if listing it fails"""
+    prototype = default_buffer_prototype()
+    semaphore = asyncio.Semaphore(MAX_CONCURRENT_FETCHES)
+
+    async def fetch(key: str) -> Optional[bytes]:
+        async with semaphore:
+            value = await store.get(key, prototype)
+        return None if value is None else value.to_bytes()
+
+    try:
+        root = await fetch("zarr.json")
+        metadata_keys = ZARR_V3_METADATA_KEYS if root is not None else ZARR_V2_METADATA_KEYS
+        names = [
+            name async for name in store.list_dir("")
+            if name not in ZARR_V3_METADATA_KEYS and name not in ZARR_V2_METADATA_KEYS
+        ]
+
+        keys = [key for key in metadata_keys if key != "zarr.json"]
+        keys += [f"{name}/{key}" for name in names for key in metadata_keys]
+        values = await asyncio.gather(*(fetch(key) for key in keys))
+    except Exception as e:
+        logger.warning(f"Could not prefetch metadata from {store}: {e}")
+        return store
+
+    metadata = dict(zip(keys, values))
+    if root is not None:
+        metadata["zarr.json"] = root
+    return PrefetchedMetadataStore(store, metadata)
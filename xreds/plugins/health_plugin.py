@@ -0,0 +1,39 @@
+from typing import Optional, Sequence
+
+from fastapi import APIRouter, Response
+from xpublish import Plugin, hookimpl
+
+from xreds.prewarm import DatasetPrewarmer
+
+
+class HealthPlugin(Plugin):
+
+    class Config:
+        arbitrary_types_allowed = True
+
+    name: str = 'health'
+
+    app_router_prefix: str = '/health'
+    app_router_tags: Sequence[str] = ['health']
+
+    prewarmer: Optional[DatasetPrewarmer] = None
+
+    @hookimpl
+    def app_router(self):
+        router = APIRouter(prefix=self.app_router_prefix, tags=list(self.app_router_tags))
+
+        @router.get('/live', summary='Check that the worker is running')
+        def live():
+            return {'status': 'ok'}
+
+        @router.get('/ready', summary='Check that the worker has finished prewarming datasets and can serve traffic')
+        def ready(response: Response):
+            if self.prewarmer is None:
+                return {'ready': True}
+
+            status = self.prewarmer.status()
+            if not status['ready']:
+                response.status_code = 503
+            return status
+
+        return router
@@ -1,5 +1,6 @@
 from typing import Sequence, Optional
 
+import xarray as xr
 from fastapi import APIRouter, Depends
 from numpy._typing import NDArray
 from xpublish import Plugin, Dependencies, hookimpl
@@ -7,7 +8,19 @@ from xpublish.utils.api import DATASET_ID_ATTR_KEY
 
 from xarray_subset_grid.grids.ugrid import assign_ugrid_topology # noqa
 
+from xreds.config import settings
+from xreds.derived_cache import dataset_generation, derived_cache
 from xreds.logging import logger
+from xreds.read_planner import plan_subset_reads
+from xreds.spatial_index import (
+    SGridSubsetIndex,
+    UGridSubsetIndex,
+    is_sgrid,
+    is_ugrid,
+    selection_indexers,
+    selection_modified_names,
+)
+from xreds.subset_cache import canonical_bbox, canonical_polygon, dataset_nbytes, subset_selection_cache
 
 
 def extract_polygon_query(subset_query: str) -> NDArray:
@@ -81,6 +94,49 @@ def extract_time_query(subset_query: str) -> tuple[str, str]:
     return start, end
 
 
+# face node connectivity variables tried, in order, for datasets without a recognized grid
+CONNECTIVITY_NODES = [None, "nv", "element"]
+
+
+def detect_subset_grid_dataset(ds):
+    """The dataset with the grid topology subsets are computed on, None if it has none
+
+    Datasets without a recognized grid are assigned a UGRID topology using the first of
+    CONNECTIVITY_NODES they contain. UGRID and SGRID grids must also be indexable to be accepted.
+    """
+    for node in CONNECTIVITY_NODES:
+        if node is not None and node not in ds.variables:
+            continue
+        try:
+            # a shallow copy, since cached values must not reference the dataset they are cached with
+            grid_ds = ds.copy(deep=False) if node is None else assign_ugrid_topology(ds, face_node_connectivity=node)
+            if grid_ds.xsg.grid is None:
+                continue
+            get_subset_index(ds, grid_ds)
+        except Exception as e:
+            logger.warning(f"Could not subset dataset with face_node_connectivity={node}: {e}")
+            continue
+
+        logger.info(f"Detected {grid_ds.xsg.grid.name} grid with face_node_connectivity={node}")
+        return grid_ds
+    return None
+
+
+def get_subset_grid_dataset(ds):
+    """Detected subset grid of a dataset, remembered for as long as the dataset is cached"""
+    return derived_cache.get(ds, "subset-grid", lambda: detect_subset_grid_dataset(ds))
+
+
+def get_subset_index(ds, grid_ds):
+    """Spatial index of the grid of a dataset, cached with the dataset. None for grids that are
+    subset by xarray_subset_grid directly"""
+    if is_ugrid(grid_ds):
+        return derived_cache.get(ds, "ugrid-index", lambda: UGridSubsetIndex(grid_ds))
+    if is_sgrid(grid_ds):
+        return derived_cache.get(ds, "sgrid-index", lambda: SGridSubsetIndex(grid_ds))
+    return None
+
+
 class SubsetQuery:
     points: Optional[NDArray]
     bbox: Optional[tuple[float, float, float, float]]
@@ -129,42 +185,142 @@ class SubsetQuery:
     def __str__(self):
         return f"SubsetQuery(points={self.points}, time={self.time})"
 
+    def canonical_geometry(self) -> str:
+        """Polygon or bbox of the query in a canonical form, for caching its selection"""
+        if self.points is not None:
+            return "POLYGON(" + ",".join(f"{x} {y}" for x, y in canonical_polygon(self.points)) + ")"
+        return "BBOX({},{},{},{})".format(*canonical_bbox(self.bbox))
+
+    def compute_selector(self, ds, grid_ds):
+        """Selector subsetting the grid of a dataset to the polygon or bbox of the query"""
+        index = get_subset_index(ds, grid_ds)
+        if self.points is not None:
+            polygon = canonical_polygon(self.points)
+            if index is not None:
+                return index.compute_polygon_subset_selector(polygon)
+            return grid_ds.xsg.grid.compute_polygon_subset_selector(grid_ds, polygon)
+
+        bbox = canonical_bbox(self.bbox)
+        if index is not None:
+            return index.compute_bbox_subset_selector(bbox)
+        return grid_ds.xsg.grid.compute_bbox_subset_selector(grid_ds, bbox)
+
+    def get_time_bounds(self) -> tuple[str, str]:
+        # Remove Z from the time strings for now to avoid issues with parsing
+        # from xarray. This is due to most datasets not using time aware
+        # times
+        # TODO: Remove this when time aware times are supported
+        return self.time[0].replace('Z', ''), self.time[1].replace('Z', '')
+
+    def get_time_indexer(self, ds) -> Optional[dict]:
+        """Positional slice of the time dimension selected by the query, None if time is
+        not an indexed dimension"""
+        time_name = ds.cf['time'].name
+        if time_name not in ds.dims or time_name not in ds.indexes:
+            return None
+        return {time_name: ds.indexes[time_name].slice_indexer(*self.get_time_bounds())}
+
+    def canonical_query(self) -> str:
+        """Geometry and time range of the query in a canonical form, for caching its subset"""
+        query = [] if self.points is None and self.bbox is None else [self.canonical_geometry()]
+        if self.time is not None:
+            query.append("TIME({},{})".format(*self.get_time_bounds()))
+        return "&".join(query)
+
     def subset(self, ds):
-        """Subset the dataset using the extracted query arguments"""
+        """Subset the dataset using the extracted query arguments
 
-        # try to subset grid using different standard connectivity node var names
-        # TODO - something smarter
-        connectivity_nodes = [None, "nv", "element"]
-        for node in connectivity_nodes:
+        With the read planner enabled, subsets selected by position are planned once and cached
+        with the selections, so every request for a subset shares its planned reads.
+        """
+        if settings.use_subset_read_planner:
             try:
-                curr_ds = ds
-                if node is not None:
-                    logger.warning(f"Failed to subset dataset - Retrying with 'assign_ugrid_topology={node}'")
-                    curr_ds = assign_ugrid_topology(curr_ds, face_node_connectivity=node)
-                if self.points is not None:
-                    curr_ds = curr_ds.xsg.grid.subset_polygon(curr_ds, self.points)
-                elif self.bbox is not None:
-                    curr_ds = curr_ds.xsg.grid.subset_bbox(curr_ds, self.bbox)
-            except:
-                continue
+                planned = subset_selection_cache.get(
+                    f"{dataset_generation(ds)}-{self.canonical_query()}-planned",
+                    lambda: self.plan_subset(ds),
+                    dataset_nbytes,
+                )
+                if planned is not None:
+                    # a copy, since the subset plugin sets the attributes of the returned dataset
+                    return planned.copy(deep=False)
+            except Exception as e:
+                logger.warning(f"Failed to plan dataset subset reads: {e}")
+
+        ds, _, _, _ = self.select_subset(ds)
+        return ds
 
-            # set ds if no errors occured during subset
-            ds = curr_ds
-            break
+    def plan_subset(self, ds) -> Optional[xr.Dataset]:
+        """The subset of the dataset, with its data read in storage chunk aligned blocks. None
+        if the subset is not a positional selection of the dataset"""
+        subset, source, indexers, skip = self.select_subset(ds, raise_on_error=True)
+        if not indexers:
+            return None
+        dataset_id = str(source.attrs.get(DATASET_ID_ATTR_KEY, ""))
+        return plan_subset_reads(source, subset, indexers, dataset_id, skip=skip)
+
+    def select_subset(self, ds, raise_on_error: bool = False):
+        """Subset of the dataset, with the dataset it was selected from, the positional indexers
+        it was selected with (None if it was selected by label) and the names of the variables
+        that are not plain positional selections"""
+        source = ds
+        indexers = {}
+        skip = set()
+        if self.points is not None or self.bbox is not None:
+            grid_ds = get_subset_grid_dataset(ds)
+            try:
+                if grid_ds is None:
+                    raise ValueError("No subsettable grid detected")
+                selector = subset_selection_cache.get(
+                    f"{dataset_generation(ds)}-{self.canonical_geometry()}",
+                    lambda: self.compute_selector(ds, grid_ds),
+                )
+                ds = selector.select(grid_ds)
+                source = grid_ds
+                indexers = selection_indexers(selector)
+                # selections on indexed dimensions are by label, not by position
+                if indexers is not None and set(indexers).intersection(grid_ds.xindexes):
+                    indexers = None
+                if indexers is not None:
+                    skip = selection_modified_names(selector, grid_ds, ds, indexers)
+            except Exception as e:
+                if raise_on_error:
+                    raise
+                logger.warning(f"Failed to subset dataset: {e}")
 
         if self.time is not None:
-            # Remove Z from the time strings for now to avoid issues with parsing
-            # from xarray. This is due to most datasets not using time aware
-            # times
-            # TODO: Remove this when time aware times are supported
-            time = (self.time[0].replace('Z', ''), self.time[1].replace('Z', ''))
-            ds = ds.cf.sel(time=slice(*time))
-        return ds
+            time_indexer = self.get_time_indexer(ds)
+            if time_indexer is None:
+                ds = ds.cf.sel(time=slice(*self.get_time_bounds()))
+                indexers = None
+            else:
+                ds = ds.isel(time_indexer)
+                if indexers is not None:
+                    indexers = {**indexers, **time_indexer}
+
+        return ds, source, indexers, skip
 
 
 def format_timestamp(value):
     return value.dt.strftime(date_format="%Y-%m-%dT%H:%M:%SZ").values
 
+
+def get_time_range(ds) -> tuple[str, str]:
+    """Min and max time of a dataset, read from the time index when it has one
+
+    The index is already in memory, and sorted indexes only need their ends checked,
+    so this does not read the time coordinate from the dataset store.
+    """
+    time = ds.cf['time']
+    time_index = ds.indexes.get(time.name, None)
+    if time_index is None or len(time_index) == 0:
+        return f'{format_timestamp(time.min())}', f'{format_timestamp(time.max())}'
+
+    if time_index.is_monotonic_increasing:
+        min_time, max_time = time_index[0], time_index[-1]
+    else:
+        min_time, max_time = time_index.min(), time_index.max()
+    return min_time.strftime("%Y-%m-%dT%H:%M:%SZ"), max_time.strftime("%Y-%m-%dT%H:%M:%SZ")
+
 class SubsetSupportPlugin(Plugin):
 
     name: str = 'subset_support'
@@ -178,8 +334,7 @@ class SubsetSupportPlugin(Plugin):
 
         @router.get('/time_range')
         def time_range(dataset=Depends(deps.dataset)):
-            min_time = dataset.cf['time'].min().dt.strftime(date_format="%Y-%m-%dT%H:%M:%SZ").values
-            max_time = dataset.cf['time'].max().dt.strftime(date_format="%Y-%m-%dT%H:%M:%SZ").values
+            min_time, max_time = get_time_range(dataset)
             return {'min_time': f'{min_time}', 'max_time': f'{max_time}'}
 
         return router
@@ -0,0 +1,109 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional
+
+from xreds.logging import logger
+
+
+class DatasetPrewarmer:
+    """Loads configured datasets into the caches when a worker starts
+
+    Datasets are opened through the dataset provider, so they get their extensions applied
+    and are added to the memory and redis caches exactly like a dataset loaded by a request.
+    Datasets are loaded in descending prewarm_priority order (from the dataset spec, 0 by
+    default) on a bounded thread pool, and datasets with prewarm: false are skipped.
+
+    The worker reports ready once every dataset has been attempted, failures are reported
+    but do not keep the worker out of rotation.
+    """
+
+    def __init__(
+        self,
+        get_dataset: Callable[[str], object],
+        get_dataset_specs: Callable[[], dict],
+        concurrency: int = 2,
+    ):
+        self.get_dataset = get_dataset
+        self.get_dataset_specs = get_dataset_specs
+        self.concurrency = max(1, concurrency)
+
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._started = False
+        self._finished = threading.Event()
+
+        self.pending: list[str] = []
+        self.loaded: dict[str, float] = {}
+        self.failed: dict[str, str] = {}
+
+    @property
+    def is_ready(self) -> bool:
+        # workers that do not prewarm are always ready
+        return not self._started or self._finished.is_set()
+
+    def start(self):
+        """Start prewarming in a background thread so the worker can serve liveness checks"""
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+
+        self._thread = threading.Thread(target=self.run, name="xreds-prewarm", daemon=True)
+        self._thread.start()
+
+    def run(self):
+        dataset_ids = self.prewarm_order(self.get_dataset_specs())
+        with self._lock:
+            self.pending = list(dataset_ids)
+
+        logger.info(f"Prewarming {len(dataset_ids)} datasets with concurrency {self.concurrency}")
+        start_time = time.time()
+        try:
+            with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="xreds-prewarm") as executor:
+                # consume the iterator so every dataset is attempted before finishing
+                list(executor.map(self._prewarm_dataset, dataset_ids))
+        finally:
+            self._finished.set()
+
+        logger.info(
+            f"Prewarmed {len(self.loaded)} datasets in {time.time() - start_time}s ({len(self.failed)} failed)"
+        )
+
+    def status(self) -> dict:
+        with self._lock:
+            return {
+                "ready": self.is_ready,
+                "pending": list(self.pending),
+                "loaded": dict(self.loaded),
+                "failed": dict(self.failed),
+            }
+
+    @staticmethod
+    def prewarm_order(dataset_specs: dict) -> list[str]:
+        """Dataset ids to prewarm, highest prewarm_priority first"""
+        dataset_ids = [
+            dataset_id
+            for dataset_id, spec in dataset_specs.items()
+            if spec.get("prewarm", True)
+        ]
+        return sorted(
+            dataset_ids,
+            key=lambda dataset_id: dataset_specs[dataset_id].get("prewarm_priority", 0),
+            reverse=True,
+        )
+
+    def _prewarm_dataset(self, dataset_id: str):
+        start_time = time.time()
+        try:
+            self.get_dataset(dataset_id)
+            with self._lock:
+                self.loaded[dataset_id] = time.time() - start_time
+        except Exception as e:
+            logger.error(f"Could not prewarm dataset {dataset_id}: {e}")
+            with self._lock:
+                self.failed[dataset_id] = str(e)
+        finally:
+            with self._lock:
+                if dataset_id in self.pending:
+                    self.pending.remove(dataset_id)
@@ -0,0 +1,242 @@
+import math
+import threading
+from typing import Optional, Union
+
+import dask
+import dask.array as da
+import numpy as np
+import xarray as xr
+
+from xreds.config import settings
+
+
+Indexer = Union[slice, np.ndarray]
+
+# a run of a dimension: the chunk aligned source range [start, stop) and the positions
+# selected from it, relative to start
+Run = tuple[int, int, np.ndarray]
+
+
+def storage_chunks(var: xr.Variable) -> Optional[tuple[int, ...]]:
+    """Chunk shape of a variable in its source store, from its encoding"""
+    chunks = var.encoding.get("chunks", None) or var.encoding.get("chunksizes", None)
+    if chunks is None:
+        preferred = var.encoding.get("preferred_chunks", None)
+        if preferred:
+            chunks = tuple(preferred.get(dim, size) for dim, size in var.sizes.items())
+    if chunks is None or len(chunks) != var.ndim:
+        return None
+    return tuple(max(1, int(chunk)) for chunk in chunks)
+
+
+class ReadPlan:
+    """Chunk aligned blocks to read for a selection of a variable
+
+    Along each dimension the selected positions are grouped by storage chunk, and runs of
+    adjacent chunks are merged into one source range. Every block of the plan is the product
+    of one run per dimension, read whole in a single call so the store fetches its chunks
+    together and every chunk is read and decompressed once.
+    """
+
+    def __init__(self, runs: list[list[Run]], chunks: tuple[int, ...]):
+        self.runs = runs
+        self.chunks = chunks
+
+        self.shape = tuple(sum(len(local) for _, _, local in dim_runs) for dim_runs in runs)
+
+
+def plan_reads(var: xr.Variable, indexers: dict[str, Indexer], max_block_bytes: int) -> Optional[ReadPlan]:
+    """Plan the reads of a selection of a variable, None if it has no known storage chunks
+    or selects positions out of order"""
+    chunks = storage_chunks(var)
+    if var.ndim == 0 or chunks is None:
+        return None
+
+    # adjacent chunks are merged until a block reaches about max_block_bytes
+    chunk_bytes = math.prod(chunks) * var.dtype.itemsize
+    max_chunks = max(1, int((max_block_bytes / chunk_bytes) ** (1 / var.ndim)))
+
+    runs = []
+    for dim, chunk in zip(var.dims, chunks):
+        positions = _get_positions(indexers.get(dim, None), var.sizes[dim])
+        dim_runs = _plan_dimension(positions, chunk, var.sizes[dim], max_chunks)
+        if dim_runs is None:
+            return None
+        runs.append(dim_runs)
+
+    return ReadPlan(runs, chunks)
+
+
+def planned_array(var: xr.Variable, plan: ReadPlan, dataset_id: str) -> da.Array:
+    """Dask array of the selection of a variable, reading each block of the plan in one task
+    and chunked like the variable's storage"""
+    if len(plan.runs) == 0 or any(len(dim_runs) == 0 for dim_runs in plan.runs):
+        return da.empty(plan.shape, dtype=var.dtype, chunks=plan.chunks)
+
+    def build(dim: int, slices: tuple, locals: tuple):
+        if dim == len(plan.runs):
+            return _block_array(var, slices, locals, plan.chunks, dataset_id)
+        return [
+            build(dim + 1, slices + (slice(start, stop),), locals + (local,))
+            for start, stop, local in plan.runs[dim]
+        ]
+
+    # clients read the subset by its chunks, which stay those of the source store
+    return da.block(build(0, (), ())).rechunk(plan.chunks)
+
+
+def _block_array(var: xr.Variable, slices: tuple, locals: tuple, chunks: tuple, dataset_id: str) -> da.Array:
+    shape = tuple(len(local) for local in locals)
+    read = _BlockRead(var, slices, locals, chunks)
+    if isinstance(var.data, da.Array):
+        # the block covers whole source chunks, rechunking merges them into a single task
+        block = var.data[slices]
+        block = block.rechunk(block.shape)
+        block = block.map_blocks(_record_block, dataset_id, read, dtype=var.dtype)
+        for axis, local in enumerate(locals):
+            if len(local) < block.shape[axis]:
+                block = block[(slice(None),) * axis + (local,)]
+        return block
+
+    # lazily indexed arrays are read with one call per block, bounded across requests.
+    # pure=False keeps dask from hashing the backend array
+    return da.from_delayed(
+        dask.delayed(_read_block, pure=False)(var, read, dataset_id),
+        shape=shape,
+        dtype=var.dtype,
+    )
+
+
+class _BlockRead:
+    """Source range of one block of a plan, and the bytes reading it selects and fetches"""
+
+    def __init__(self, var: xr.Variable, slices: tuple, locals: tuple, chunks: tuple):
+        self.slices = slices
+        self.locals = locals
+
+        itemsize = var.dtype.itemsize
+        self.selected_bytes = math.prod(len(local) for local in locals) * itemsize
+        self.fetched_bytes = math.prod(s.stop - s.start for s in slices) * itemsize
+        self.chunk_reads = math.prod(-(-(s.stop - s.start) // chunk) for s, chunk in zip(slices, chunks))
+
+    def __dask_tokenize__(self):
+        return (self.slices, [local.tobytes() for local in self.locals])
+
+
+_read_semaphore = threading.BoundedSemaphore(max(1, settings.subset_read_concurrency))
+
+
+def _read_block(var: xr.Variable, read: _BlockRead, dataset_id: str) -> np.ndarray:
+    with _read_semaphore:
+        block = np.asarray(var[read.slices].values)
+    read_plan_stats.record_read(dataset_id, read)
+    return block[np.ix_(*read.locals)]
+
+
+def _record_block(block: np.ndarray, dataset_id: str, read: _BlockRead) -> np.ndarray:
+    read_plan_stats.record_read(dataset_id, read)
+    return block
+
+
+def _get_positions(indexer: Optional[Indexer], size: int) -> np.ndarray:
+    if indexer is None:
+        return np.arange(size)
+    if isinstance(indexer, slice):
+        return np.arange(size)[indexer]
+    return np.asarray(indexer, dtype=np.int64).reshape(-1)
+
+
+def _plan_dimension(positions: np.ndarray, chunk: int, size: int, max_chunks: int) -> Optional[list[Run]]:
+    if len(positions) == 0:
+        return []
+    if np.any(np.diff(positions) <= 0):
+        return None
+
+    chunk_ids = positions // chunk
+    runs = []
+    # a gap of untouched chunks ends a run, as does reaching max_chunks chunks
+    for group in np.split(np.arange(len(positions)), np.flatnonzero(np.diff(chunk_ids) > 1) + 1):
+        spans = (chunk_ids[group] - chunk_ids[group[0]]) // max_chunks
+        for part in np.split(group, np.flatnonzero(np.diff(spans)) + 1):
+            start = int(chunk_ids[part[0]]) * chunk
+            stop = min((int(chunk_ids[part[-1]]) + 1) * chunk, size)
+            runs.append((start, stop, positions[part] - start))
+    return runs
+
+
+class ReadPlanStats:
+    """Selected against fetched (chunk aligned) bytes of the subset reads of each dataset
+
+    Plans are counted when they are built, bytes and chunks when their blocks are read.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._datasets: dict[str, dict[str, int]] = {}
+
+    def record_plan(self, dataset_id: str):
+        with self._lock:
+            self._get_stats(dataset_id)["plans"] += 1
+
+    def record_read(self, dataset_id: str, read: "_BlockRead"):
+        with self._lock:
+            stats = self._get_stats(dataset_id)
+            stats["blocks_read"] += 1
+            stats["chunk_reads"] += read.chunk_reads
+            stats["selected_bytes"] += read.selected_bytes
+            stats["fetched_bytes"] += read.fetched_bytes
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                dataset_id: {
+                    **stats,
+                    "fetched_ratio": stats["fetched_bytes"] / stats["selected_bytes"] if stats["selected_bytes"] else None,
+                }
+                for dataset_id, stats in self._datasets.items()
+            }
+
+    def _get_stats(self, dataset_id: str) -> dict[str, int]:
+        return self._datasets.setdefault(dataset_id, {
+            "plans": 0,
+            "blocks_read": 0,
+            "chunk_reads": 0,
+            "selected_bytes": 0,
+            "fetched_bytes": 0,
+        })
+
+
+read_plan_stats = ReadPlanStats()
+
+
+def plan_subset_reads(
+    source: xr.Dataset,
+    subset: xr.Dataset,
+    indexers: dict[str, Indexer],
+    dataset_id: str,
+    skip: Optional[set[str]] = None,
+) -> xr.Dataset:
+    """Replace the lazy data variables of a subset of source, selected positionally with
+    indexers, with arrays read through chunk aligned read plans. Variables in skip, that
+    are not plain selections of source, are kept as they are"""
+    max_block_bytes = settings.subset_read_block_mb * 1024 * 1024
+
+    planned = {}
+    for name, var in subset.data_vars.items():
+        source_var = source.variables.get(name, None)
+        if skip is not None and name in skip:
+            continue
+        if source_var is None or var.variable._in_memory or source_var._in_memory:
+            continue
+        if source_var.dims != var.dims:
+            continue
+
+        plan = plan_reads(source_var, indexers, max_block_bytes)
+        if plan is None or plan.shape != var.shape:
+            continue
+
+        planned[name] = var.copy(data=planned_array(source_var, plan, dataset_id))
+
+    if len(planned) > 0:
+        read_plan_stats.record_plan(dataset_id)
+    return subset.assign(planned)
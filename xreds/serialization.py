@@ -0,0 +1,175 @@
+import hashlib
+import pickle
+import struct
+import zlib
+from typing import Callable, Optional
+
+import xarray as xr
+
+from xreds.logging import logger
+
+
+# Frame layout of a serialized dataset, all integers little endian:
+#
+#   magic (4) | version (u8) | codec (u8) | spec digest (32) | buffer count (u32) | pickle length (u64)
+#   | buffer lengths (u64 * buffer count) | pickled structure | raw buffers...
+#
+# The dataset structure (attributes, encodings, lazy dask graphs) is pickled with protocol 5,
+# while every numpy buffer it contains - decoded coordinates, indexes and any loaded variables -
+# is written out of band after it. The dask graphs of the lazy variables are still pickled,
+# only the array buffers skip the pickle stream. Without compression the buffers are rehydrated
+# zero-copy as views of the payload, otherwise each one is decompressed exactly once.
+#
+# The spec digest is the sha256 of the spec hash, so spec hashes of any length are compared in full.
+FRAME_MAGIC = b"XRDS"
+FRAME_VERSION = 2
+FRAME_HEADER = struct.Struct("<4sBB32sIQ")
+BUFFER_LENGTH = struct.Struct("<Q")
+
+
+class SerializationError(Exception):
+    """Raised when a serialized dataset payload can not be read"""
+
+
+def _zstd_codec() -> tuple[Callable[[bytes], bytes], Callable[[bytes], bytes]]:
+    import zstandard
+
+    return zstandard.ZstdCompressor(level=3).compress, zstandard.ZstdDecompressor().decompress
+
+
+def _lz4_codec() -> tuple[Callable[[bytes], bytes], Callable[[bytes], bytes]]:
+    import lz4.frame
+
+    return lz4.frame.compress, lz4.frame.decompress
+
+
+def _zlib_codec() -> tuple[Callable[[bytes], bytes], Callable[[bytes], bytes]]:
+    return (lambda data: zlib.compress(data, 1)), zlib.decompress
+
+
+def _none_codec() -> tuple[Callable[[bytes], bytes], Callable[[bytes], bytes]]:
+    return bytes, bytes
+
+
+# codec ids are stored in the payload, so they must never be renumbered
+CODECS: dict[str, tuple[int, Callable]] = {
+    "none": (0, _none_codec),
+    "zlib": (1, _zlib_codec),
+    "zstd": (2, _zstd_codec),
+    "lz4": (3, _lz4_codec),
+}
+CODEC_NAMES = {codec_id: name for name, (codec_id, _) in CODECS.items()}
+
+
+def _resolve_codec(compression: str) -> tuple[int, Callable[[bytes], bytes]]:
+    """Get the codec id and compressor for a compression name, falling back to zlib
+    when the optional compression library is not installed"""
+    compression = (compression or "none").lower()
+    if compression not in CODECS:
+        raise ValueError(f"Unsupported compression '{compression}', expected one of {list(CODECS.keys())}")
+
+    codec_id, codec = CODECS[compression]
+    try:
+        compress, _ = codec()
+    except ImportError:
+        logger.warning(f"Compression library for '{compression}' is not installed, falling back to zlib")
+        codec_id, codec = CODECS["zlib"]
+        compress, _ = codec()
+    return codec_id, compress
+
+
+def serialize_dataset(ds: xr.Dataset, spec_hash: str = "", compression: str = "none") -> bytes:
+    """Serialize a dataset into a compact frame for the redis cache
+
+    Args:
+        ds (xr.Dataset): The dataset to serialize
+        spec_hash (str): Hash of the dataset spec the dataset was loaded from
+        compression (str): One of none, zlib, zstd or lz4
+
+    Returns:
+        bytes: The serialized dataset
+    """
+    codec_id, compress = _resolve_codec(compression)
+
+    buffers: list[pickle.PickleBuffer] = []
+    structure = compress(pickle.dumps(ds, protocol=5, buffer_callback=buffers.append))
+
+    raw_buffers = []
+    for buffer in buffers:
+        try:
+            raw = buffer.raw()
+        except BufferError:
+            # non contiguous buffers can not be exposed as raw bytes
+            raw = memoryview(bytes(buffer))
+        raw_buffers.append(compress(raw) if codec_id != 0 else raw)
+
+    parts = [
+        FRAME_HEADER.pack(
+            FRAME_MAGIC,
+            FRAME_VERSION,
+            codec_id,
+            _spec_digest(spec_hash),
+            len(raw_buffers),
+            len(structure),
+        ),
+        *[BUFFER_LENGTH.pack(len(raw)) for raw in raw_buffers],
+        structure,
+        *raw_buffers,
+    ]
+    return b"".join(parts)
+
+
+def _spec_digest(spec_hash: str) -> bytes:
+    return hashlib.sha256(spec_hash.encode()).digest()
+
+
+def deserialize_dataset(payload: bytes, spec_hash: Optional[str] = None) -> Optional[xr.Dataset]:
+    """Rehydrate a dataset serialized with serialize_dataset
+
+    Array buffers are wrapped without copying when the payload is not compressed, so they
+    are read only and share memory with the payload.
+
+    Args:
+        payload (bytes): The serialized dataset
+        spec_hash (str, optional): When provided, datasets serialized from a different dataset
+            spec are ignored
+
+    Returns:
+        xr.Dataset | None: The dataset, or None if it was serialized from a different spec
+    """
+    view = memoryview(payload)
+    if len(view) < FRAME_HEADER.size:
+        raise SerializationError("Serialized dataset is truncated")
+
+    magic, version, codec_id, payload_digest, num_buffers, structure_length = FRAME_HEADER.unpack_from(view)
+    if magic != FRAME_MAGIC:
+        raise SerializationError("Serialized dataset has an unknown format")
+    if version != FRAME_VERSION:
+        raise SerializationError(f"Unsupported serialized dataset version {version}")
+    if codec_id not in CODEC_NAMES:
+        raise SerializationError(f"Unsupported serialized dataset codec {codec_id}")
+
+    if spec_hash is not None and payload_digest != _spec_digest(spec_hash):
+        return None
+
+    _, decompress = CODECS[CODEC_NAMES[codec_id]][1]()
+
+    offset = FRAME_HEADER.size
+    buffer_lengths = []
+    for _ in range(num_buffers):
+        buffer_lengths.append(BUFFER_LENGTH.unpack_from(view, offset)[0])
+        offset += BUFFER_LENGTH.size
+
+    structure = view[offset:offset + structure_length]
+    offset += structure_length
+
+    buffers = []
+    for length in buffer_lengths:
+        raw = view[offset:offset + length]
+        offset += length
+        buffers.append(raw if codec_id == 0 else decompress(raw))
+
+    if offset != len(view):
+        raise SerializationError("Serialized dataset is truncated")
+
+    return pickle.loads(decompress(structure) if codec_id != 0 else structure, buffers=buffers)
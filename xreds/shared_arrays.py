@@ -0,0 +1,262 @@
+import os
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from collections import Counter
+from typing import Optional
+
+import numpy as np
+import xarray as xr
+
+from xreds.config import settings
+from xreds.logging import logger
+
+
+# variable names commonly used for mesh connectivity that are not always marked with a cf_role
+CONNECTIVITY_VARIABLE_NAMES = ("nv", "element", "ele", "face_node_connectivity")
+
+
+def default_shared_array_dir() -> str:
+    """Shared memory backed tmpfs when available so mapped arrays never touch disk"""
+    if os.path.isdir("/dev/shm"):
+        return "/dev/shm/xreds"
+    return os.path.join(tempfile.gettempdir(), "xreds-shared")
+
+
+def is_shared_array(array) -> bool:
+    """Whether an array is backed by a memory mapped file instead of worker memory"""
+    while array is not None:
+        if isinstance(array, np.memmap):
+            return True
+        array = getattr(array, "base", None)
+    return False
+
+
+def connectivity_variable_names(ds: xr.Dataset) -> set[str]:
+    """Names of the mesh connectivity variables of a dataset"""
+    connectivity_names = set()
+    for var in ds.variables.values():
+        if var.attrs.get("cf_role", None) == "mesh_topology":
+            for attr in ("face_node_connectivity", "edge_node_connectivity", "face_face_connectivity"):
+                if attr in var.attrs:
+                    connectivity_names.add(var.attrs[attr])
+    for name, var in ds.variables.items():
+        if name in CONNECTIVITY_VARIABLE_NAMES or str(var.attrs.get("cf_role", "")).endswith("_connectivity"):
+            connectivity_names.add(name)
+    return connectivity_names.intersection(ds.variables)
+
+
+def shareable_variable_names(ds: xr.Dataset) -> list[str]:
+    """Names of the static coordinate and mesh connectivity variables of a dataset
+
+    Indexed coordinates are excluded because pandas copies them into its own index, and
+    variables along the time dimension are excluded because they grow with the dataset.
+    """
+    try:
+        time_dims = set(ds.cf["time"].dims)
+    except Exception:
+        time_dims = set()
+
+    connectivity_names = connectivity_variable_names(ds)
+
+    names = []
+    for name, var in ds.variables.items():
+        if name in ds.xindexes or var.ndim == 0:
+            continue
+        if name not in ds.coords and name not in connectivity_names:
+            continue
+        if time_dims.intersection(var.dims):
+            continue
+        names.append(name)
+    return names
+
+
+class SharedArrayStore:
+    """Decoded arrays shared read-only between the gunicorn workers of a node
+
+    Arrays are written once as .npy files under root/<dataset spec hash>/, named after their
+    variable, and every worker memory maps the same file. Workers that load the same dataset
+    therefore end up holding a single copy of its coordinates in the page cache, and only the
+    first one to share an array reads its values.
+
+    Each worker records the files it references with a marker file named after its pid, and
+    files without a live referencing process are removed by cleanup.
+    """
+
+    def __init__(self, root: str, cleanup_grace_seconds: int = 60):
+        self.root = root
+        self.cleanup_grace_seconds = cleanup_grace_seconds
+
+        self._lock = threading.Lock()
+        self._counts: Counter[str] = Counter()
+        self._owners: dict[str, set[str]] = {}
+
+        os.makedirs(self.root, exist_ok=True)
+
+    def share_dataset(
+        self,
+        ds: xr.Dataset,
+        spec_hash: str,
+        owner: str,
+        names: Optional[list[str]] = None,
+    ) -> xr.Dataset:
+        """Replace the static coordinate and connectivity arrays of a dataset (or the given
+        variables) with shared, read only memory mapped arrays. Previously shared arrays of
+        the owner are released"""
+        paths: set[str] = set()
+        coords = {}
+        data_vars = {}
+
+        for name in names if names is not None else shareable_variable_names(ds):
+            var = ds.variables[name]
+            if is_shared_array(var._data) or var.dtype.hasobject:
+                continue
+
+            try:
+                path = self._acquire(spec_hash, str(name), var)
+                paths.add(path)
+                shared = np.load(path, mmap_mode="r", allow_pickle=False)
+            except OSError as e:
+                logger.warning(f"Could not share array {name} of {owner}: {e}")
+                continue
+
+            if name in ds.coords:
+                coords[name] = var.copy(data=shared)
+            else:
+                data_vars[name] = var.copy(data=shared)
+
+        self.release(owner)
+        with self._lock:
+            self._owners[owner] = paths
+
+        if len(paths) > 0:
+            logger.info(f"Shared {len(paths)} arrays of {owner} between workers")
+        return ds.assign_coords(coords).assign(data_vars)
+
+    def release(self, owner: str):
+        """Drop the references an owner holds, removing arrays no process references anymore"""
+        with self._lock:
+            paths = self._owners.pop(owner, set())
+            for path in paths:
+                self._counts[path] -= 1
+                if self._counts[path] <= 0:
+                    del self._counts[path]
+                    self._remove_marker(path)
+
+        if len(paths) > 0:
+            self.cleanup()
+
+    def cleanup(self):
+        """Remove arrays that are not referenced by any live process"""
+        now = time.time()
+        for spec_dir in self._list_dirs(self.root):
+            for entry in os.scandir(spec_dir):
+                if not entry.is_file():
+                    continue
+                try:
+                    if now - entry.stat().st_mtime < self.cleanup_grace_seconds:
+                        continue
+                    if entry.name.endswith(".tmp"):
+                        # left behind by a worker that died while writing
+                        os.remove(entry.path)
+                        continue
+                    if not entry.name.endswith(".npy"):
+                        continue
+                    if self._has_live_references(entry.path):
+                        continue
+                    os.remove(entry.path)
+                    shutil.rmtree(self._get_refs_dir(entry.path), ignore_errors=True)
+                    logger.info(f"Removed unreferenced shared array {entry.path}")
+                except FileNotFoundError:
+                    continue
+
+            try:
+                os.rmdir(spec_dir)
+            except OSError:
+                pass
+
+    def _acquire(self, spec_hash: str, name: str, var: xr.Variable) -> str:
+        path = os.path.join(self.root, spec_hash, f"{name}.npy")
+
+        with self._lock:
+            # the marker is written before the array so cleanup never removes an array being shared
+            if self._counts[path] == 0:
+                os.makedirs(self._get_refs_dir(path), exist_ok=True)
+                with open(os.path.join(self._get_refs_dir(path), str(os.getpid())), "w"):
+                    pass
+            self._counts[path] += 1
+
+        # arrays are only read and written when no worker has shared them for the spec yet
+        if not self._is_shared(path, var):
+            tmp_path = f"{path}.{os.getpid()}-{uuid.uuid4().hex}.tmp"
+            try:
+                data = np.ascontiguousarray(var.values)
+                with open(tmp_path, "wb") as f:
+                    np.save(f, data, allow_pickle=False)
+                os.replace(tmp_path, path)
+            except OSError:
+                with self._lock:
+                    self._counts[path] -= 1
+                    if self._counts[path] <= 0:
+                        del self._counts[path]
+                        self._remove_marker(path)
+                raise
+            finally:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+
+        return path
+
+    @staticmethod
+    def _is_shared(path: str, var: xr.Variable) -> bool:
+        try:
+            shared = np.load(path, mmap_mode="r", allow_pickle=False)
+        except (FileNotFoundError, ValueError):
+            return False
+        return shared.shape == var.shape and shared.dtype == var.dtype
+
+    def _remove_marker(self, path: str):
+        try:
+            os.remove(os.path.join(self._get_refs_dir(path), str(os.getpid())))
+        except FileNotFoundError:
+            pass
+
+    def _has_live_references(self, path: str) -> bool:
+        refs_dir = self._get_refs_dir(path)
+        if not os.path.isdir(refs_dir):
+            return False
+
+        has_live_reference = False
+        for entry in os.scandir(refs_dir):
+            try:
+                os.kill(int(entry.name), 0)
+                has_live_reference = True
+            except (ValueError, ProcessLookupError):
+                # stale marker left behind by a process that exited without releasing
+                os.remove(entry.path)
+            except PermissionError:
+                has_live_reference = True
+        return has_live_reference
+
+    @staticmethod
+    def _get_refs_dir(path: str) -> str:
+        return f"{path}.refs"
+
+    @staticmethod
+    def _list_dirs(root: str) -> list[str]:
+        if not os.path.isdir(root):
+            return []
+        return [entry.path for entry in os.scandir(root) if entry.is_dir()]
+
+
+def create_shared_array_store(enabled: bool, root: str) -> Optional[SharedArrayStore]:
+    if not enabled:
+        return None
+    return SharedArrayStore(root or default_shared_array_dir())
+
+
+# a single store per process, so the datasets of the provider and the static datasets share
+# one table of owners and reference counts over the same root
+shared_array_store = create_shared_array_store(settings.use_shared_arrays, settings.shared_array_dir)
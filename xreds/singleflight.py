@@ -0,0 +1,116 @@
+import json
+import threading
+import time
+from concurrent.futures import Future
+from typing import Optional
+
+import redis
+
+from xreds.logging import logger
+
+
+class SingleFlight:
+    """Shares one in-flight dataset load between every thread of a worker
+
+    The first thread to request a key becomes the leader and is responsible for
+    resolving the future, every other thread blocks on the same future and receives
+    the leader's result or exception as soon as it is set.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._in_flight: dict[str, Future] = {}
+
+    def join(self, key: str) -> tuple[Future, bool]:
+        """Join the in-flight load for key, returning the shared future and whether
+        the caller is the leader that must resolve it"""
+        with self._lock:
+            future = self._in_flight.get(key, None)
+            if future is not None:
+                return future, False
+
+            future = Future()
+            future.set_running_or_notify_cancel()
+            self._in_flight[key] = future
+            return future, True
+
+    def forget(self, key: str, future: Future):
+        """Remove a resolved future so the next request starts a new flight"""
+        with self._lock:
+            if self._in_flight.get(key, None) is future:
+                del self._in_flight[key]
+
+    def is_in_flight(self, key: str) -> bool:
+        with self._lock:
+            return key in self._in_flight
+
+
+class DatasetLoadFailedError(Exception):
+    """Raised in waiting workers when the worker loading a dataset failed"""
+
+
+class RedisLoadNotifier:
+    """Notifies waiting workers through redis pub/sub when a dataset load finishes"""
+
+    # how often waiters re-check the loading key in case the loading worker died
+    # without publishing - this is a safety net, not the primary wake up mechanism
+    liveness_interval: float = 5.0
+
+    def __init__(self, redis_cache: redis.Redis):
+        self.redis_cache = redis_cache
+
+    def publish(self, dataset_id: str, spec_hash: str, error: Optional[BaseException] = None):
+        message = {"status": "loaded"} if error is None else {
+            "status": "failed",
+            "error": f"{type(error).__name__}: {error}",
+        }
+        try:
+            self.redis_cache.publish(self._get_channel(dataset_id, spec_hash), json.dumps(message))
+        except redis.RedisError as e:
+            logger.warning(f"Could not publish load notification for {dataset_id}: {e}")
+
+    def wait(self, dataset_id: str, spec_hash: str, is_loading, timeout: Optional[float] = None) -> bool:
+        """Block until the worker loading dataset_id with the spec hashed to spec_hash publishes
+        its result
+
+        is_loading is called to avoid missing a notification published before the
+        subscription was active and to detect workers that died mid load.
+
+        Returns True when a completion message was received, False when the loading
+        flag disappeared without one. Raises DatasetLoadFailedError if the loading
+        worker reported a failure.
+        """
+        pubsub = self.redis_cache.pubsub(ignore_subscribe_messages=True)
+        try:
+            pubsub.subscribe(self._get_channel(dataset_id, spec_hash))
+            if not is_loading():
+                return False
+
+            deadline = None if timeout is None else time.monotonic() + timeout
+            while deadline is None or time.monotonic() < deadline:
+                wait_time = self.liveness_interval
+                if deadline is not None:
+                    wait_time = max(0.0, min(wait_time, deadline - time.monotonic()))
+
+                message = pubsub.get_message(timeout=wait_time)
+                if message is None:
+                    if not is_loading():
+                        return False
+                    continue
+
+                payload = json.loads(message["data"])
+                if payload.get("status") == "failed":
+                    raise DatasetLoadFailedError(
+                        f"Loading dataset {dataset_id} failed in another worker: {payload.get('error')}"
+                    )
+                return True
+
+            return False
+        finally:
+            pubsub.close()
+
+    # channels include the spec hash like the cache keys, so a load of a changed spec never
+    # wakes workers waiting on the previous one
+    @staticmethod
+    def _get_channel(dataset_id: str, spec_hash: str):
+        return f"loaded-{dataset_id}-{spec_hash}"
@@ -0,0 +1,389 @@
+import warnings
+from typing import Optional, Union
+
+import dask.array as da
+import numpy as np
+import xarray as xr
+from xarray_subset_grid.grids.sgrid import _get_location_info_from_topology
+from xarray_subset_grid.grids.ugrid import UGridSelector
+from xarray_subset_grid.selector import Selector
+from xarray_subset_grid.utils import normalize_polygon_x_coords, ray_tracing_numpy
+
+
+class UniformGridIndex:
+    """Uniform grid over 2D points for finding the points in a bounding box without a full scan
+
+    Points are bucketed into cells of roughly points_per_cell points and sorted by cell, so
+    the points of a row of cells are one contiguous run of the sorted order.
+    """
+
+    def __init__(self, x: np.ndarray, y: np.ndarray, points_per_cell: int = 16):
+        self.x = np.asarray(x, dtype=np.float64)
+        self.y = np.asarray(y, dtype=np.float64)
+
+        valid = np.isfinite(self.x) & np.isfinite(self.y)
+        if not valid.any():
+            self.bounds = (0.0, 0.0, 0.0, 0.0)
+            self.nx = self.ny = 1
+            self.order = np.zeros(0, dtype=np.int64)
+            self.offsets = np.zeros(2, dtype=np.int64)
+            return
+
+        x_min, x_max = float(self.x[valid].min()), float(self.x[valid].max())
+        y_min, y_max = float(self.y[valid].min()), float(self.y[valid].max())
+        self.bounds = (x_min, y_min, x_max, y_max)
+
+        # square-ish cells, sized so each holds about points_per_cell points on average
+        n_cells = max(1, int(valid.sum()) // max(1, points_per_cell))
+        width, height = max(x_max - x_min, 1e-12), max(y_max - y_min, 1e-12)
+        self.nx = max(1, min(4096, int(round(np.sqrt(n_cells * width / height)))))
+        self.ny = max(1, min(4096, int(round(n_cells / self.nx))))
+
+        points = np.flatnonzero(valid)
+        cells = self._cell_ids(self.x[points], self.y[points])
+        sort = np.argsort(cells, kind="stable")
+        self.order = points[sort]
+        self.offsets = np.searchsorted(cells[sort], np.arange(self.nx * self.ny + 1))
+
+    def query_bbox(self, bbox: tuple[float, float, float, float]) -> np.ndarray:
+        """Sorted indices of the points inside bbox (minx, miny, maxx, maxy)"""
+        min_x, min_y, max_x, max_y = bbox
+        x_min, y_min, x_max, y_max = self.bounds
+        if len(self.order) == 0 or min_x > x_max or max_x < x_min or min_y > y_max or max_y < y_min:
+            return np.zeros(0, dtype=np.int64)
+
+        i0, i1 = self._cell_range(max(min_x, x_min), min(max_x, x_max), x_min, x_max, self.nx)
+        j0, j1 = self._cell_range(max(min_y, y_min), min(max_y, y_max), y_min, y_max, self.ny)
+
+        rows = np.arange(j0, j1 + 1) * self.nx
+        starts, ends = self.offsets[rows + i0], self.offsets[rows + i1 + 1]
+        candidates = np.concatenate([self.order[start:end] for start, end in zip(starts, ends)])
+
+        x, y = self.x[candidates], self.y[candidates]
+        inside = (x >= min_x) & (x <= max_x) & (y >= min_y) & (y <= max_y)
+        return np.sort(candidates[inside])
+
+    def _cell_ids(self, x: np.ndarray, y: np.ndarray) -> np.ndarray:
+        x_min, y_min, x_max, y_max = self.bounds
+        i = np.clip(((x - x_min) / max(x_max - x_min, 1e-12) * self.nx).astype(np.int64), 0, self.nx - 1)
+        j = np.clip(((y - y_min) / max(y_max - y_min, 1e-12) * self.ny).astype(np.int64), 0, self.ny - 1)
+        return j * self.nx + i
+
+    @staticmethod
+    def _cell_range(low: float, high: float, min_value: float, max_value: float, n: int) -> tuple[int, int]:
+        scale = n / max(max_value - min_value, 1e-12)
+        start = int(np.clip(np.floor((low - min_value) * scale), 0, n - 1))
+        end = int(np.clip(np.floor((high - min_value) * scale), 0, n - 1))
+        return start, end
+
+
+class UGridSubsetIndex:
+    """Spatial index of a UGRID mesh for polygon and bbox subsetting
+
+    Builds the same selectors as xarray_subset_grid's UGrid - every face with a node inside
+    the polygon, and every node of those faces - but only tests the nodes in the polygon's
+    bounding box, and finds the faces of the nodes inside through a node to face lookup
+    instead of scanning the whole connectivity array.
+    """
+
+    def __init__(self, ds: xr.Dataset):
+        try:
+            mesh = ds.cf["mesh_topology"]
+        except KeyError as err:
+            raise ValueError("Dataset has no mesh topology variable") from err
+
+        x_var, y_var = mesh.node_coordinates.split(" ")
+        self.node_dimension = ds[x_var].dims[0]
+        self.face_dimension = mesh.attrs.get("face_dimension", None)
+        if not self.face_dimension:
+            raise ValueError("face_dimension is required to subset UGRID datasets")
+
+        x = np.asarray(ds[x_var].values, dtype=np.float64)
+        y = np.asarray(ds[y_var].values, dtype=np.float64)
+        self.x_range = np.array([np.nanmin(x), np.nanmax(x)])
+        self.grid = UniformGridIndex(x, y)
+
+        self.face_node_connectivity_key = mesh.face_node_connectivity
+        self.face_node_connectivity, self.transpose_face_node = self._face_first(
+            ds[self.face_node_connectivity_key]
+        )
+        start_index = ds[self.face_node_connectivity_key].attrs.get("start_index", None)
+        if not start_index:
+            warnings.warn("No start_index found in face_node_connectivity, assuming 0")
+            start_index = 0
+
+        # zero based nodes of each face, with masked nodes replaced by the first node of the face
+        faces = np.nan_to_num(self.face_node_connectivity.astype(np.float64), nan=-1) - start_index
+        faces = np.where(faces >= 0, faces, faces[:, :1]).astype(np.int64)
+        self.faces = faces
+
+        # node to face lookup, as the faces of node n in node_faces[node_offsets[n]:node_offsets[n + 1]]
+        nodes = faces.ravel()
+        face_ids = np.repeat(np.arange(faces.shape[0]), faces.shape[1])
+        valid = nodes >= 0
+        sort = np.argsort(nodes[valid], kind="stable")
+        self.node_faces = face_ids[valid][sort]
+        self.node_offsets = np.searchsorted(nodes[valid][sort], np.arange(len(x) + 1))
+
+        self.face_face_connectivity_key: Optional[str] = None
+        self.face_face_connectivity: Optional[np.ndarray] = None
+        self.transpose_face_face = False
+        if "face_face_connectivity" in mesh.attrs:
+            self.face_face_connectivity_key = mesh.face_face_connectivity
+            self.face_face_connectivity, self.transpose_face_face = self._face_first(
+                ds[self.face_face_connectivity_key]
+            )
+
+    def compute_polygon_subset_selector(self, polygon: np.ndarray, name: Optional[str] = None) -> UGridSelector:
+        polygon = normalize_polygon_x_coords(self.x_range, np.array(polygon, dtype=np.float64))
+
+        # only points within the bounding box of the polygon can be inside it
+        candidates = self.grid.query_bbox(
+            (polygon[:, 0].min(), polygon[:, 1].min(), polygon[:, 0].max(), polygon[:, 1].max())
+        )
+        nodes_inside = candidates[
+            ray_tracing_numpy(self.grid.x[candidates], self.grid.y[candidates], polygon)
+        ]
+
+        selected_elements = np.unique(self._faces_of(nodes_inside))
+        selected_nodes = np.unique(self.faces[selected_elements])
+
+        face_node_new = np.searchsorted(selected_nodes, self.face_node_connectivity[selected_elements])
+        if self.transpose_face_node:
+            face_node_new = face_node_new.T
+
+        face_face_new = None
+        if self.face_face_connectivity is not None:
+            face_face_new = np.searchsorted(selected_elements, self.face_face_connectivity[selected_elements])
+            if self.transpose_face_face:
+                face_face_new = face_face_new.T
+
+        return UGridSelector(
+            name=name or "selector",
+            polygon=polygon,
+            node_dimension=self.node_dimension,
+            selected_nodes=selected_nodes,
+            face_dimension=self.face_dimension,
+            selected_elements=selected_elements,
+            face_node_connectivity_key=self.face_node_connectivity_key,
+            face_node_connectivity=face_node_new,
+            face_face_connectivity_key=self.face_face_connectivity_key,
+            face_face_connectivity=face_face_new,
+        )
+
+    def compute_bbox_subset_selector(
+        self, bbox: tuple[float, float, float, float], name: Optional[str] = None
+    ) -> UGridSelector:
+        return self.compute_polygon_subset_selector(_bbox_polygon(bbox), name)
+
+    def _faces_of(self, nodes: np.ndarray) -> np.ndarray:
+        starts, ends = self.node_offsets[nodes], self.node_offsets[nodes + 1]
+        lengths = ends - starts
+        if lengths.sum() == 0:
+            return np.zeros(0, dtype=np.int64)
+        # gather every run node_faces[start:end] at once
+        positions = np.repeat(starts - np.cumsum(lengths) + lengths, lengths) + np.arange(lengths.sum())
+        return self.node_faces[positions]
+
+    def _face_first(self, connectivity: xr.DataArray) -> tuple[np.ndarray, bool]:
+        if connectivity.dims[0] == self.face_dimension:
+            return np.asarray(connectivity.values), False
+        return np.asarray(connectivity.values).T, True
+
+
+class SGridWindowSelector(Selector):
+    """Selector slicing the variables of each SGRID location to an index window
+
+    The masks xarray_subset_grid computes for SGRID subsets are always the padded bounding
+    window of the grid points inside the polygon, so only the window is kept. Slicing with it
+    keeps the dataset lazy and only touches the chunks inside the window.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        polygon: np.ndarray,
+        grid_topology_key: str,
+        grid_topology: xr.DataArray,
+        windows: list[tuple[list[str], dict[str, slice]]],
+    ):
+        super().__init__()
+        self.name = name
+        self.polygon = polygon
+        self._grid_topology_key = grid_topology_key
+        self._grid_topology = grid_topology
+        self._windows = windows
+
+    def select(self, ds: xr.Dataset) -> xr.Dataset:
+        ds_out = xr.merge([_drop_encoding(ds[names].isel(window)) for names, window in self._windows])
+        return ds_out.assign({self._grid_topology_key: self._grid_topology})
+
+
+def _drop_encoding(ds: xr.Dataset) -> xr.Dataset:
+    # Dataset.drop_encoding reads lazily indexed variables into memory, while the windows
+    # should stay lazy until their data is read. isel shares the variables it does not index
+    # with the source, so the encodings are cleared on shallow copies
+    ds = ds.copy(deep=False)
+    for var in ds.variables.values():
+        var.encoding = {}
+    return ds
+
+
+class SGridSubsetIndex:
+    """Spatial index of a curvilinear SGRID grid, like ROMS, for polygon and bbox subsetting
+
+    Builds the same windows as xarray_subset_grid's SGrid, but only tests the grid nodes in
+    the polygon's bounding box instead of evaluating the whole grid against the polygon.
+    """
+
+    def __init__(self, ds: xr.Dataset):
+        self.grid_topology_key = ds.cf.cf_roles["grid_topology"][0]
+        self.grid_topology = ds[self.grid_topology_key]
+
+        node_info = _get_location_info_from_topology(self.grid_topology, "node")
+        node_lon, node_lat = self._get_lon_lat(ds, node_info["coords"])
+        self.shape = node_lon.shape
+        self.node_dims = node_lon.dims
+        self.node_vars = self._get_location_vars(ds, node_info["dims"])
+
+        lon = np.asarray(node_lon.values, dtype=np.float64).ravel()
+        lat = np.asarray(node_lat.values, dtype=np.float64).ravel()
+        self.x_range = np.array([np.nanmin(lon), np.nanmax(lon)])
+        self.grid = UniformGridIndex(lon, lat)
+
+        # variables, dimensions and high side padding of the face and edge locations
+        self.locations: list[tuple[list[str], tuple[str, ...], list[int]]] = []
+        for location in ("face", "edge1", "edge2"):
+            info = _get_location_info_from_topology(self.grid_topology, location)
+            lon, _ = self._get_lon_lat(ds, info["coords"], require_lat=False)
+            padding = [0 if info["padding"][d] in ("none", "low") else 1 for d in lon.dims]
+            self.locations.append((self._get_location_vars(ds, info["dims"]), lon.dims, padding))
+
+    def compute_polygon_subset_selector(self, polygon: np.ndarray, name: Optional[str] = None) -> SGridWindowSelector:
+        polygon = normalize_polygon_x_coords(self.x_range, np.array(polygon, dtype=np.float64))
+
+        # only points within the bounding box of the polygon can be inside it
+        candidates = self.grid.query_bbox(
+            (polygon[:, 0].min(), polygon[:, 1].min(), polygon[:, 0].max(), polygon[:, 1].max())
+        )
+        inside = candidates[ray_tracing_numpy(self.grid.x[candidates], self.grid.y[candidates], polygon)]
+        if len(inside) == 0:
+            raise ValueError("No grid points inside the polygon")
+
+        # bounding window of the points inside, padded by one node
+        rows, cols = np.unravel_index(inside, self.shape)
+        row_start, row_end = max(0, int(rows.min()) - 1), min(self.shape[0], int(rows.max()) + 2)
+        col_start, col_end = max(0, int(cols.min()) - 1), min(self.shape[1], int(cols.max()) + 2)
+
+        windows = [(self.node_vars, {
+            self.node_dims[0]: slice(row_start, row_end),
+            self.node_dims[1]: slice(col_start, col_end),
+        })]
+        for names, dims, padding in self.locations:
+            windows.append((names, {
+                dims[0]: slice(row_start, row_end + padding[0]),
+                dims[1]: slice(col_start, col_end + padding[1]),
+            }))
+
+        return SGridWindowSelector(
+            name=name or "selector",
+            polygon=polygon,
+            grid_topology_key=self.grid_topology_key,
+            grid_topology=self.grid_topology,
+            windows=windows,
+        )
+
+    def compute_bbox_subset_selector(
+        self, bbox: tuple[float, float, float, float], name: Optional[str] = None
+    ) -> SGridWindowSelector:
+        return self.compute_polygon_subset_selector(_bbox_polygon(bbox), name)
+
+    @staticmethod
+    def _get_location_vars(ds: xr.Dataset, dims: list[str]) -> list[str]:
+        return [name for name in ds.variables if set(dims).issubset(ds[name].dims)]
+
+    @staticmethod
+    def _get_lon_lat(
+        ds: xr.Dataset, coords: list[str], require_lat: bool = True
+    ) -> tuple[xr.DataArray, Optional[xr.DataArray]]:
+        lon = lat = None
+        for name in coords:
+            standard_name = ds[name].attrs.get("standard_name", "").lower()
+            if "lon" in standard_name:
+                lon = ds[name]
+            elif "lat" in standard_name:
+                lat = ds[name]
+        if lon is None or (require_lat and lat is None):
+            raise ValueError(f"Could not find longitude and latitude in {coords}")
+        return lon, lat
+
+
+def selection_indexers(selector: Selector) -> Optional[dict[str, Union[slice, np.ndarray]]]:
+    """Positional indexers a selector selects with, None for selectors that do not select by position"""
+    if isinstance(selector, SGridWindowSelector):
+        indexers = {}
+        for _, window in selector._windows:
+            indexers.update(window)
+        return indexers
+    if isinstance(selector, UGridSelector):
+        return {
+            selector._node_dimension: selector._selected_nodes,
+            selector._face_dimension: selector._selected_elements,
+        }
+    return None
+
+
+def selection_modified_names(
+    selector: Selector,
+    ds: xr.Dataset,
+    ds_subset: xr.Dataset,
+    indexers: dict[str, Union[slice, np.ndarray]],
+) -> set[str]:
+    """Names of the variables of a selection of ds that are not plain positional selections
+    of it, like the face connectivity a UGRID selector renumbers"""
+    names = set()
+    if isinstance(selector, UGridSelector):
+        names.update(
+            key
+            for key in (selector._face_node_connectivity_key, selector._face_face_connectivity_key)
+            if key is not None
+        )
+    if isinstance(selector, SGridWindowSelector):
+        names.add(selector._grid_topology_key)
+
+    # dask names are tokens of the graph, so any other change made by the selector shows
+    # as a name that differs from the positional selection
+    for name, var in ds_subset.variables.items():
+        source_var = ds.variables.get(name, None)
+        if name in names or source_var is None or not isinstance(var._data, da.Array):
+            continue
+        expected = source_var.isel({dim: indexer for dim, indexer in indexers.items() if dim in source_var.dims})
+        if not isinstance(expected._data, da.Array) or expected._data.name != var._data.name:
+            names.add(name)
+    return names
+
+
+def _bbox_polygon(bbox: tuple[float, float, float, float]) -> np.ndarray:
+    return np.array(
+        [
+            [bbox[0], bbox[3]],
+            [bbox[0], bbox[1]],
+            [bbox[2], bbox[1]],
+            [bbox[2], bbox[3]],
+            [bbox[0], bbox[3]],
+        ]
+    )
+
+
+def is_ugrid(ds: xr.Dataset) -> bool:
+    """Whether subsets of a dataset are computed by xarray_subset_grid's UGrid"""
+    from xarray_subset_grid.grids import UGrid
+
+    return isinstance(ds.xsg.grid, UGrid)
+
+
+def is_sgrid(ds: xr.Dataset) -> bool:
+    """Whether subsets of a dataset are computed by xarray_subset_grid's SGrid"""
+    from xarray_subset_grid.grids import SGrid
+
+    return isinstance(ds.xsg.grid, SGrid)
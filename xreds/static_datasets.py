@@ -0,0 +1,125 @@
+import threading
+import time
+from typing import Optional
+
+import xarray as xr
+
+from xreds.config import settings
+from xreds.dataset_utils import hash_dataset_spec, load_dataset
+from xreds.logging import logger
+from xreds.shared_arrays import SharedArrayStore, shared_array_store
+from xreds.singleflight import SingleFlight
+
+
+# seconds a static dataset that could not be opened is remembered as missing, so requests
+# using it do not retry the open every time, while a dataset that appears is picked up soon
+MISSING_DATASET_TTL = 60
+
+
+class StaticDatasetStore:
+    """Process wide store of auxiliary datasets that do not change, like vdatum grids
+
+    Datasets are opened once per process and shared by every dataset and extension that
+    references them, instead of being reopened whenever the datasets using them reload.
+    Entries are keyed by the hash of their dataset spec and expire after ttl seconds
+    (0 = never), or after MISSING_DATASET_TTL seconds for datasets that could not be
+    opened. When load is enabled datasets are read fully into memory, and memory
+    mapped from the shared array store when one is given so every worker of a node maps
+    the same copy.
+    """
+
+    def __init__(
+        self,
+        ttl: int = 0,
+        load: bool = False,
+        shared_arrays: Optional[SharedArrayStore] = None,
+    ):
+        self.ttl = ttl
+        self.load = load
+        self.shared_arrays = shared_arrays
+
+        self._lock = threading.Lock()
+        self._datasets: dict[str, tuple[Optional[xr.Dataset], float]] = {}
+        self._single_flight = SingleFlight()
+
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, dataset_spec: dict) -> Optional[xr.Dataset]:
+        key = hash_dataset_spec(dataset_spec)
+        with self._lock:
+            entry = self._datasets.get(key, None)
+            if entry is not None and not self._is_expired(*entry):
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+
+        future, is_leader = self._single_flight.join(key)
+        if not is_leader:
+            return future.result()
+
+        try:
+            ds = self._load_dataset(key, dataset_spec)
+            future.set_result(ds)
+            return ds
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            self._single_flight.forget(key, future)
+
+    def clear(self):
+        with self._lock:
+            keys = list(self._datasets.keys())
+            self._datasets.clear()
+        if self.shared_arrays is not None:
+            for key in keys:
+                self.shared_arrays.release(self._get_owner(key))
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "datasets": sum(ds is not None for ds, _ in self._datasets.values()),
+                "missing_datasets": sum(ds is None for ds, _ in self._datasets.values()),
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+    def _load_dataset(self, key: str, dataset_spec: dict) -> Optional[xr.Dataset]:
+        start_time = time.time()
+        ds = load_dataset(dict(dataset_spec))
+        if ds is None:
+            logger.warning(
+                f"Could not open static dataset {dataset_spec.get('path', key)}, "
+                f"not retrying for {MISSING_DATASET_TTL}s"
+            )
+            with self._lock:
+                self._datasets[key] = (None, time.time())
+            return None
+
+        if self.load:
+            ds = ds.load()
+            if self.shared_arrays is not None:
+                names = [name for name in ds.variables if name not in ds.xindexes]
+                ds = self.shared_arrays.share_dataset(ds, key, self._get_owner(key), names=names)
+
+        with self._lock:
+            self._datasets[key] = (ds, time.time())
+
+        logger.info(f"Loaded static dataset {dataset_spec.get('path', key)} in {time.time() - start_time}s")
+        return ds
+
+    def _is_expired(self, ds: Optional[xr.Dataset], loaded_at: float) -> bool:
+        ttl = MISSING_DATASET_TTL if ds is None else self.ttl
+        return ttl > 0 and time.time() - loaded_at >= ttl
+
+    @staticmethod
+    def _get_owner(key: str) -> str:
+        return f"static-{key}"
+
+
+static_dataset_store = StaticDatasetStore(
+    ttl=settings.static_dataset_cache_timeout,
+    load=settings.load_static_datasets,
+    shared_arrays=shared_array_store,
+)
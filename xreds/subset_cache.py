@@ -0,0 +1,140 @@
+import threading
+from collections import OrderedDict
+from typing import Callable, Optional, TypeVar
+
+import numpy as np
+import xarray as xr
+from xarray_subset_grid.selector import Selector
+
+from xreds.config import settings
+from xreds.logging import logger
+from xreds.singleflight import SingleFlight
+
+
+T = TypeVar("T")
+
+# decimals coordinates are rounded to, ~0.1m in degrees
+COORDINATE_DECIMALS = 6
+
+
+def canonical_polygon(points: np.ndarray) -> np.ndarray:
+    """Polygon rounded, closed and wound counter clockwise starting from its smallest vertex
+
+    Whether a point is inside a polygon does not depend on its winding or starting vertex, so
+    polygons that only differ in those select the same points.
+    """
+    points = np.round(np.asarray(points, dtype=np.float64), COORDINATE_DECIMALS)
+    if len(points) > 1 and np.array_equal(points[0], points[-1]):
+        points = points[:-1]
+
+    x, y = points[:, 0], points[:, 1]
+    if np.sum(x * np.roll(y, -1) - np.roll(x, -1) * y) < 0:
+        points = points[::-1]
+
+    start = np.lexsort((points[:, 1], points[:, 0]))[0]
+    points = np.roll(points, -start, axis=0)
+    return np.concatenate([points, points[:1]])
+
+
+def canonical_bbox(bbox: tuple[float, float, float, float]) -> tuple[float, float, float, float]:
+    min_x, min_y, max_x, max_y = (round(float(c), COORDINATE_DECIMALS) for c in bbox)
+    return min(min_x, max_x), min(min_y, max_y), max(min_x, max_x), max(min_y, max_y)
+
+
+def selector_nbytes(selector: Selector) -> int:
+    """Bytes held by the index arrays of a selector"""
+    return sum(int(getattr(value, "nbytes", 0)) for value in vars(selector).values())
+
+
+def dataset_nbytes(ds: Optional[xr.Dataset]) -> int:
+    """Bytes held by the in memory variables of a lazily selected dataset"""
+    if ds is None:
+        return 0
+    return sum(var.nbytes for var in ds.variables.values() if var._in_memory)
+
+
+class SubsetSelectionCache:
+    """LRU cache of polygon and bbox subset selectors, and the subsets planned from them,
+    bounded by a byte budget
+
+    Keys combine the generation of the dataset object with the canonicalized query, so a
+    reloaded dataset never reuses the selections of its previous version. Concurrent
+    requests for the same missing selection share a single computation.
+    """
+
+    def __init__(self, max_bytes: int = 0):
+        # 0 = disabled
+        self.max_bytes = max_bytes
+
+        self._lock = threading.Lock()
+        self._lru: OrderedDict[str, tuple[object, int]] = OrderedDict()
+        self._current_bytes = 0
+        self._single_flight = SingleFlight()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.rejections = 0
+
+    def get(self, key: str, build: Callable[[], T], nbytes: Callable[[T], int] = selector_nbytes) -> T:
+        if self.max_bytes <= 0:
+            return build()
+
+        with self._lock:
+            entry = self._lru.get(key, None)
+            if entry is not None:
+                self._lru.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+
+        future, is_leader = self._single_flight.join(key)
+        if not is_leader:
+            return future.result()
+
+        try:
+            value = build()
+            self._put(key, value, nbytes(value))
+            future.set_result(value)
+            return value
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            self._single_flight.forget(key, future)
+
+    def clear(self):
+        with self._lock:
+            self._lru.clear()
+            self._current_bytes = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "selections": len(self._lru),
+                "current_bytes": self._current_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "rejections": self.rejections,
+            }
+
+    def _put(self, key: str, value: object, nbytes: int):
+        with self._lock:
+            if nbytes > self.max_bytes:
+                self.rejections += 1
+                logger.warning(
+                    f"Subset selection {key} ({nbytes} bytes) is larger than the subset cache budget, not caching"
+                )
+                return
+
+            self._lru[key] = (value, nbytes)
+            self._current_bytes += nbytes
+            while self._current_bytes > self.max_bytes and len(self._lru) > 0:
+                _, (_, evicted_bytes) = self._lru.popitem(last=False)
+                self._current_bytes -= evicted_bytes
+                self.evictions += 1
+
+
+subset_selection_cache = SubsetSelectionCache(settings.subset_cache_max_mb * 1024 * 1024)